@@ -1,18 +1,74 @@
 from flask import Flask
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
-from api.models import Base
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import scoped_session, sessionmaker
+from api.models import Base, products_name_index, name_key
 """
 Module that acts as base for other modules.
+
+Each request gets its own session from a thread-local registry backed by the
+engine's connection pool. The session is removed when the application context
+ends.
+
+Product names are unique regardless of case. Databases created before the
+unique index on the name key existed may hold names that differ only in
+case; the API refuses to start on them until those products are renamed or
+deleted.
 """
 
 
 app = Flask(__name__)
-engine = create_engine("sqlite:///shop.db")
+engine = create_engine(
+    "sqlite:///shop.db",
+    pool_size=10,
+    max_overflow=20,
+    connect_args={'check_same_thread': False}
+)
 Base.metadata.create_all(engine)
-session = Session(engine)
+
+
+def create_name_index(engine):
+    """
+    Add the name key column and its unique index to an existing database.
+
+    The keys of the products created before the column existed are filled
+    in first. Raises a RuntimeError listing the products whose names differ
+    only in case, which must be renamed or deleted before the index can be
+    created; no product is deleted.
+    """
+    with engine.begin() as connection:
+        indexes = [row[1] for row in connection.execute(text("PRAGMA index_list(products)"))]
+        if products_name_index.name in indexes:
+            return
+        columns = [row[1] for row in connection.execute(text("PRAGMA table_info(products)"))]
+        if 'name_key' not in columns:
+            connection.execute(text("ALTER TABLE products ADD COLUMN name_key VARCHAR(30)"))
+        rows = connection.execute(text("SELECT id, name FROM products WHERE name_key IS NULL")).all()
+        if rows:
+            connection.execute(text("UPDATE products SET name_key = :key WHERE id = :id"),
+                               [{'id': row.id, 'key': name_key(row.name)} for row in rows])
+        conflicts = connection.execute(text(
+            "SELECT name_key, group_concat(id, ', ') FROM products "
+            "GROUP BY name_key HAVING count(*) > 1"
+        )).all()
+        if conflicts:
+            raise RuntimeError('Product names must be unique regardless of case; rename or delete '
+                               'the duplicates before starting the API: ' + '; '.join(
+                                   f'[ {key} ] ids {ids}' for key, ids in conflicts))
+        connection.execute(text("DROP INDEX IF EXISTS ix_products_name_lower"))
+        products_name_index.create(connection)
+
+
+create_name_index(engine)
+session = scoped_session(sessionmaker(bind=engine))
+
+
+@app.teardown_appcontext
+def remove_session(exception=None):
+    """
+    Close the current thread's session at the end of the application context.
+    """
+    session.remove()
 
 
 from api.views import root
 app.register_blueprint(root)
-
@@ -1,7 +1,7 @@
 from typing import List
 from typing import Optional
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, Integer
+from sqlalchemy import String, Integer, Index
 
 """
 This module defines the database metadata using SQLAlchemy.
@@ -14,13 +14,36 @@ class Base(DeclarativeBase):
     """
     pass
 
+def name_key(name):
+    """
+    Return the key product names are compared by, regardless of case.
+
+    The key is computed in Python with str.casefold(), which folds every
+    Unicode letter, rather than with SQLite's lower(), which only folds ASCII.
+    """
+    return name.casefold()
+
+
+def name_key_default(context):
+    """
+    Compute the name key of a product inserted or renamed by any statement.
+    """
+    return name_key(context.get_current_parameters()['name'])
+
+
 class Products(Base):
     """
     A class representing the Products table in the database.
+
+    Product names are unique regardless of case, which the unique index on
+    name_key enforces; it also serves every lookup by name. name_key is
+    set from the name on every insert and update.
     """
     __tablename__ = "products"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String(30), nullable=False)
+    name_key: Mapped[str] = mapped_column(String(30), nullable=False,
+                                          default=name_key_default, onupdate=name_key_default)
 
     def __repr__(self) -> str:
         """
@@ -28,3 +51,4 @@ class Products(Base):
         """
         return f"Products(id={self.id!r}, name={self.name!r})"
 
+products_name_index = Index('ix_products_name_key', Products.name_key, unique=True)
@@ -2,16 +2,71 @@
 A module to handle all http requests to the Flask application
 
 This module handles all the root routes of the API. It handles
-GET, POST, PUT, DELETE requests to the root route.
+GET, POST, PUT, DELETE requests to the root route, and bulk POST, PUT,
+DELETE requests with a JSON body to the /bulk route.
 """
 
 from api import app, session
 from flask import request, jsonify, Blueprint
-from sqlalchemy.exc import NoResultFound
-from api.models import Products
+from sqlalchemy import update, delete
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import NoResultFound, IntegrityError
+from api.models import Products, name_key
 
 
 root = Blueprint('root', __name__)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_BULK_SIZE = 10000
+# The largest SQLite INTEGER, which ids must fit in
+MAX_ID = 2 ** 63 - 1
+
+
+def parse_number(value):
+    """
+    Parse a query parameter made of ASCII digits.
+
+    Returns the number, or None if the value has other characters, such as
+    signs or digits from other scripts that str.isdigit() accepts but int()
+    does not, or is larger than MAX_ID.
+    """
+    if not value.isascii() or not value.isdigit() or int(value) > MAX_ID:
+        return None
+    return int(value)
+
+
+def parse_limit(value):
+    """
+    Parse the page size requested in the 'limit' query parameter.
+
+    Returns the page size capped at MAX_PAGE_SIZE, DEFAULT_PAGE_SIZE when
+    no limit is given, or None if the limit is not a positive integer.
+    """
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    limit = parse_number(value)
+    if limit is None or limit < 1:
+        return None
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def prefix_upper_bound(prefix):
+    """
+    Return the smallest string greater than every string starting with the
+    prefix, so a prefix match becomes a range on the name index, or None
+    if the prefix is only made of the last code point, U+10FFFF.
+
+    Trailing U+10FFFF characters cannot be incremented and are dropped, and
+    an increment that lands on a surrogate, which SQLite cannot store,
+    skips to U+E000.
+    """
+    prefix = prefix.rstrip(chr(0x10FFFF))
+    if not prefix:
+        return None
+    code = ord(prefix[-1]) + 1
+    if 0xD800 <= code <= 0xDFFF:
+        code = 0xE000
+    return prefix[:-1] + chr(code)
 
 
 @root.route('/', methods=['GET', 'POST', 'PUT', 'DELETE'])
@@ -26,27 +81,24 @@ def index():
         """
         Handles POST requests to the root route.
 
-        If the request body contains a name, it checks if the product
-        already exists in the database. If it does, it returns a 409
-        status code with a message indicating that the product already
-        exists. If it does not, it creates a new product and returns a
-        201 status code with a message indicating that the product has
-        been added.
+        If the request body contains a name, it inserts the product
+        with a single INSERT ... ON CONFLICT DO NOTHING statement, so
+        concurrent requests cannot both add the same name. If a product
+        with that name (in any case) already exists, nothing is inserted
+        and it returns a 409 status code with a message indicating that
+        the product already exists. Otherwise it returns a 201 status
+        code with a message indicating that the product has been added.
         """
-        existing_product = None
         if body_name:
-            try:
-                existing_product = session.query(
-                        Products).filter(
-                                Products.name == body_name.lower()).one()
+            product_id = session.execute(
+                    insert(Products).values(name=body_name)
+                    .on_conflict_do_nothing().returning(Products.id)).scalar()
+            session.commit()
+            if product_id is None:
                 return jsonify(
                         {'status': 'error', 'message': 'product already exists'}), 409
-            except NoResultFound as error:
-                new_product = Products(name=body_name)
-                session.add(new_product)
-                session.commit()
-                return jsonify({'status': 'success',
-                    'message': 'product has been added'}), 201
+            return jsonify({'status': 'success',
+                'message': 'product has been added'}), 201
         return jsonify({'status': 'error', 'message': 'invalid request'}), 400
 
     if request.method == 'GET':
@@ -58,54 +110,80 @@ def index():
         404 status code with a message indicating that the product does
         not exist. If it does, it returns a 200 status code with the
         product details.
+
+        Otherwise it returns a page of at most 'limit' products (100 by
+        default, 1000 at most) ordered by id, and the 'next_cursor' to
+        pass as 'after' for the next page, or null on the last page.
+        With a 'prefix', only the products whose name starts with it (in
+        any case) are returned, ordered by name: the prefix is read as a
+        range of the index on the name key, and the cursor is the key of
+        the last name returned.
         """
         if query_name:
             try:
                 product = session.query(Products).filter(
-                        Products.name == query_name.lower()).one()
+                        Products.name_key == name_key(query_name)).one()
                 product = {'id': product.id, 'name': product.name}
                 return jsonify({'status': 'success', 'product': product}), 200
             except NoResultFound as error:
                 return jsonify({'status': 'error',
                     'message': f'product [{query_name}] does not exist'}), 404
+        limit = parse_limit(request.args.get('limit'))
+        prefix = name_key(request.args.get('prefix', ''))
+        after = request.args.get('after')
+        if limit is None or (after is not None and not prefix and parse_number(after) is None):
+            return jsonify({'status': 'error', 'message': 'invalid request'}), 400
+        query = session.query(Products)
+        if prefix:
+            query = query.filter(Products.name_key >= prefix)
+            upper_bound = prefix_upper_bound(prefix)
+            if upper_bound is not None:
+                query = query.filter(Products.name_key < upper_bound)
+            if after is not None:
+                query = query.filter(Products.name_key > name_key(after))
+            query = query.order_by(Products.name_key)
         else:
-            products = session.query(Products).all()
+            if after is not None:
+                query = query.filter(Products.id > parse_number(after))
+            query = query.order_by(Products.id)
+        products = query.limit(limit + 1).all()
+        next_cursor = None
+        if len(products) > limit:
+            products = products[:limit]
+            next_cursor = products[-1].name_key if prefix else str(products[-1].id)
         product_list = [{'id': product.id, 'name': product.name} for product in products]
-        return jsonify({'status': 'success', 'products': product_list}), 200
+        return jsonify({'status': 'success', 'products': product_list,
+            'next_cursor': next_cursor}), 200
 
     if request.method == 'PUT':
         """
         Handles PUT requests to the root route.
 
         If a name is provided in the query parameters and the request
-        body, it checks if the product already exists in the database.
-        If it does, it updates the product and returns a 200 status code
-        with a message indicating that the product has been updated. If
-        it does not, it returns a 404 status code with a message
-        indicating that the product does not exist. If the request body
-        name is different from the query parameter name, it returns a
-        409 status code with a message indicating that the product
-        already exists.
+        body, it renames the product with a single UPDATE statement. If
+        no product has the query name, it returns a 404 status code with
+        a message indicating that the product does not exist. If another
+        product already has the body name, the unique index rejects the
+        update and it returns a 409 status code with a message indicating
+        that the product already exists. Otherwise it returns a 200
+        status code with a message indicating that the product has been
+        updated.
         """
-        query_product = None
-        body_product = None
         if query_name and body_name:
             try:
-                query_product = session.query(Products).filter(
-                    Products.name == query_name.lower()).one()
-            except NoResultFound as error:
-                return jsonify({'status': 'error',
-                    'message': f'product [ {query_name} ] does not exist'}), 404
-            try:
-                body_product = session.query(Products).filter(
-                    Products.name == body_name.lower()).one()
+                result = session.execute(update(Products).where(
+                    Products.name_key == name_key(query_name)).values(
+                        name=body_name.lower()))
+                session.commit()
+            except IntegrityError as error:
+                session.rollback()
                 return jsonify({'status': 'error',
                     'message': f'product [ {body_name} ] already exists'}), 409
-            except NoResultFound as error:
-                query_product.name = body_name.lower()
-                session.commit()
-                return jsonify({'status': 'success',
-                    'message': 'product has been updated'}), 200
+            if result.rowcount == 0:
+                return jsonify({'status': 'error',
+                    'message': f'product [ {query_name} ] does not exist'}), 404
+            return jsonify({'status': 'success',
+                'message': 'product has been updated'}), 200
         return jsonify({'status': 'error', 'message': 'invalid request'}), 400
 
     if request.method == 'DELETE':
@@ -122,8 +200,9 @@ def index():
         if query_name:
             try:
                 product = session.query(Products).filter(
-                        Products.name == query_name.lower()).one()
+                        Products.name_key == name_key(query_name)).one()
                 session.delete(product)
+                session.commit()
                 return jsonify({'status': 'success',
                     'message': f'product has been deleted'}), 204
             except NoResultFound as error:
@@ -147,7 +226,8 @@ def product_by_id(ID):
     given ID exists in the database. If it does not, it returns a 404
     status code with a message indicating that the product does not
     exist. If it does, it updates the product and returns a 200 status
-    code with a message indicating that the product has been updated.
+    code with a message indicating that the product has been updated,
+    or a 409 status code if another product already has the new name.
 
     If the request method is DELETE, it searches for the product with
     the given ID in the database. If it does not exist, it returns a 404
@@ -173,7 +253,12 @@ def product_by_id(ID):
         if body_name:
             if product.name != body_name:
                 product.name = body_name.lower()
-                session.commit()
+                try:
+                    session.commit()
+                except IntegrityError as error:
+                    session.rollback()
+                    return jsonify({'status': 'error',
+                        'message': f'product [ {body_name} ] already exists'}), 409
                 return jsonify({'status': 'success',
                     'message': 'product has been updated'}), 200
             return jsonify({'status': 'error',
@@ -182,5 +267,136 @@ def product_by_id(ID):
 
     if request.method == 'DELETE':
         session.delete(product)
+        session.commit()
         return jsonify({'status': 'success',
             'message': f'product has been deleted'}), 204
+
+
+def read_bulk_items(key):
+    """
+    Read the list of items under the given key of the JSON request body.
+
+    Returns the list, or None if the body has no non-empty list of at most
+    MAX_BULK_SIZE items under that key.
+    """
+    data = request.get_json(silent=True)
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items or len(items) > MAX_BULK_SIZE:
+        return None
+    return items
+
+
+def is_id(value):
+    """
+    Check that a value decoded from JSON can be used as a product id: an
+    integer, not a boolean, within the range of a SQLite INTEGER.
+    """
+    return type(value) is int and -MAX_ID - 1 <= value <= MAX_ID
+
+
+def is_name(value):
+    """
+    Check that a value can be used as a product name.
+    """
+    return isinstance(value, str) and value.strip() != ''
+
+
+@root.route('/bulk', methods=['POST', 'PUT', 'DELETE'], strict_slashes=False)
+def bulk():
+    """
+    Handles bulk POST, PUT, DELETE requests to the /bulk route.
+
+    Every item is processed in one transaction with a single commit, and
+    the items that could not be applied are reported in 'errors' with
+    their 'index' in the request and a message, while the others are
+    applied. A body without a non-empty list of at most MAX_BULK_SIZE
+    items returns a 400 status code.
+
+    POST takes {"names": [...]} and creates a product for each name with
+    INSERT ... ON CONFLICT DO NOTHING, reporting the names that already
+    exist. The products created are returned in 'created'.
+
+    PUT takes {"products": [{"id": <id>, "new_name": ...}, ...]}, where
+    a product can also be selected by its current "name" instead of its
+    id, and renames each product with UPDATE OR IGNORE, reporting the
+    products that do not exist and the new names that already exist. The
+    number of products renamed is returned in 'updated'.
+
+    DELETE takes {"ids": [...]} or {"names": [...]} and deletes all the
+    products with a single DELETE statement, reporting the ids or names
+    that do not exist. The number of products deleted is returned in
+    'deleted'.
+    """
+    errors = []
+
+    if request.method == 'POST':
+        names = read_bulk_items('names')
+        if names is None:
+            return jsonify({'status': 'error', 'message': 'invalid request'}), 400
+        created = []
+        statement = insert(Products).on_conflict_do_nothing().returning(Products.id)
+        for index, name in enumerate(names):
+            if not is_name(name):
+                errors.append({'index': index, 'message': 'invalid name'})
+                continue
+            product_id = session.execute(statement.values(name=name)).scalar()
+            if product_id is None:
+                errors.append({'index': index,
+                    'message': f'product [ {name} ] already exists'})
+            else:
+                created.append({'id': product_id, 'name': name})
+        session.commit()
+        return jsonify({'status': 'success', 'created': created,
+            'errors': errors}), 200
+
+    if request.method == 'PUT':
+        items = read_bulk_items('products')
+        if items is None:
+            return jsonify({'status': 'error', 'message': 'invalid request'}), 400
+        updated = 0
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not is_name(item.get('new_name')):
+                errors.append({'index': index, 'message': 'invalid product'})
+                continue
+            if is_id(item.get('id')):
+                selected = Products.id == item['id']
+            elif 'id' not in item and is_name(item.get('name')):
+                selected = Products.name_key == name_key(item['name'])
+            else:
+                errors.append({'index': index, 'message': 'invalid product'})
+                continue
+            new_name = item['new_name'].lower()
+            result = session.execute(update(Products).prefix_with('OR IGNORE')
+                .where(selected).values(name=new_name))
+            if result.rowcount:
+                updated += result.rowcount
+            elif session.query(Products.id).filter(selected).first() is None:
+                errors.append({'index': index, 'message': 'product does not exist'})
+            else:
+                errors.append({'index': index,
+                    'message': f'product [ {item["new_name"]} ] already exists'})
+        session.commit()
+        return jsonify({'status': 'success', 'updated': updated,
+            'errors': errors}), 200
+
+    if request.method == 'DELETE':
+        data = request.get_json(silent=True)
+        key = 'ids' if isinstance(data, dict) and 'ids' in data else 'names'
+        items = read_bulk_items(key)
+        valid = is_id if key == 'ids' else is_name
+        if items is None or not all(valid(item) for item in items):
+            return jsonify({'status': 'error', 'message': 'invalid request'}), 400
+        if key == 'ids':
+            selected = Products.id.in_(items)
+        else:
+            selected = Products.name_key.in_([name_key(name) for name in items])
+        deleted = session.execute(delete(Products).where(selected)
+            .returning(Products.id, Products.name)).all()
+        session.commit()
+        found = {row.id for row in deleted} if key == 'ids' else {name_key(row.name) for row in deleted}
+        for index, item in enumerate(items):
+            if (item if key == 'ids' else name_key(item)) not in found:
+                errors.append({'index': index,
+                    'message': f'product [ {item} ] does not exist'})
+        return jsonify({'status': 'success', 'deleted': len(deleted),
+            'errors': errors}), 200
@@ -1,6 +1,10 @@
 import unittest
 from api.models import Products
 from api import session
+from sqlalchemy import text, create_engine
+import os
+import tempfile
+from sqlalchemy.exc import IntegrityError
 
 class TestDatabase(unittest.TestCase):
 
@@ -28,4 +32,54 @@ class TestDatabase(unittest.TestCase):
         session.add(product2)
         session.commit()
         
-        self.assertEqual(product2.id, product1.id + 1)
\ No newline at end of file
+        self.assertEqual(product2.id, product1.id + 1)
+
+    def test_name_unique_ignoring_case(self):
+        '''
+        Test if product names are unique regardless of case, through the index on the name key
+        '''
+        session.add(Products(name="Unique Élan"))
+        session.commit()
+        session.add(Products(name="UNIQUE élan"))
+        with self.assertRaises(IntegrityError):
+            session.commit()
+        session.rollback()
+        product = session.query(Products).filter(Products.name == "Unique Élan").one()
+        self.assertEqual(product.name_key, "unique élan")
+        plan = session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM products WHERE name_key = 'unique élan'")).all()
+        self.assertIn('ix_products_name_key', plan[0][-1])
+
+    def test_name_prefix_uses_index(self):
+        '''
+        Test if a name prefix is read as a range of the index on the name key
+        '''
+        plan = session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM products WHERE name_key >= 'te' AND name_key < 'tf' "
+            "ORDER BY name_key")).all()
+        self.assertIn('USING INDEX ix_products_name_key', plan[0][-1])
+        self.assertNotIn('TEMP B-TREE', ' '.join(row[-1] for row in plan))
+
+    def test_name_index_refuses_duplicates(self):
+        '''
+        Test if an existing database gets its name keys, and no index or deletion over names differing only in case
+        '''
+        from api import create_name_index
+        with tempfile.TemporaryDirectory() as directory:
+            legacy = create_engine(f"sqlite:///{os.path.join(directory, 'legacy.db')}")
+            with legacy.begin() as connection:
+                connection.execute(text("CREATE TABLE products (id INTEGER PRIMARY KEY, name VARCHAR(30) NOT NULL)"))
+                connection.execute(text("INSERT INTO products (name) VALUES ('Lamp'), ('LAMP'), ('Élan'), ('élan')"))
+            with self.assertRaises(RuntimeError) as error:
+                create_name_index(legacy)
+            self.assertIn('[ lamp ] ids 1, 2', str(error.exception))
+            self.assertIn('[ élan ] ids 3, 4', str(error.exception))
+            with legacy.connect() as connection:
+                self.assertEqual(connection.execute(text("SELECT count(*) FROM products")).scalar(), 4)
+                connection.execute(text("DELETE FROM products WHERE id IN (2, 4)"))
+                connection.commit()
+            create_name_index(legacy)
+            with legacy.connect() as connection:
+                keys = connection.execute(text("SELECT name_key FROM products ORDER BY id")).scalars().all()
+                self.assertEqual(keys, ['lamp', 'élan'])
+            legacy.dispose()
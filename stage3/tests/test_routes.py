@@ -1,6 +1,7 @@
 import unittest
 from api import app, session
 from api.models import Products
+from api.views import prefix_upper_bound
 import json
 """
 Tests for the API views
@@ -41,6 +42,56 @@ class TestViews(unittest.TestCase):
         self.assertEqual(response.headers['Content-Type'], 'application/json')
         self.assertEqual(json.loads(response.data.decode('utf-8'))['products'][0], {"id": 1, "name": "Test Product1"}   )
 
+    def test_get_all_products_paginated(self):
+        """
+        Test that a GET request to '/' with a limit returns the products page by page
+        """
+        response = self.app.get('/?limit=2')
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([product['id'] for product in data['products']], [1, 2])
+        self.assertEqual(data['next_cursor'], '2')
+        response = self.app.get(f"/?limit=2&after={data['next_cursor']}")
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([product['id'] for product in data['products']], [3])
+        self.assertIsNone(data['next_cursor'])
+        self.assertEqual(self.app.get('/?limit=0').status_code, 400)
+        self.assertEqual(self.app.get('/?after=abc').status_code, 400)
+        for value in ('\u00b2', '\u0663', str(2 ** 63)):
+            self.assertEqual(self.app.get('/', query_string={'limit': value}).status_code, 400)
+            self.assertEqual(self.app.get('/', query_string={'after': value}).status_code, 400)
+
+    def test_get_products_by_prefix(self):
+        """
+        Test that a GET request to '/' with a prefix returns the matching products ordered by name
+        """
+        self.app.post('/', data={'name': 'Tea Cup'})
+        self.app.post('/', data={'name': 'Toaster'})
+        response = self.app.get('/?prefix=TE&limit=2')
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([product['name'] for product in data['products']], ['Tea Cup', 'Test Product1'])
+        self.assertEqual(data['next_cursor'], 'test product1')
+        response = self.app.get(f"/?prefix=te&after={data['next_cursor']}")
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([product['name'] for product in data['products']], ['Test Product2', 'Test Product3'])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_get_products_by_prefix_unicode(self):
+        """
+        Test that a prefix matches accented names in any case and that any last code point is accepted
+        """
+        self.app.post('/', data={'name': 'Élan'})
+        response = self.app.get('/?prefix=é')
+        self.assertEqual([product['name'] for product in json.loads(response.data.decode('utf-8'))['products']],
+                         ['Élan'])
+        for prefix in ('\U0010ffff', 'a\U0010ffff', '\ud7ff'):
+            response = self.app.get('/', query_string={'prefix': prefix})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.data.decode('utf-8'))['products'], [])
+        self.assertEqual(prefix_upper_bound('te'), 'tf')
+        self.assertEqual(prefix_upper_bound('a\U0010ffff'), 'b')
+        self.assertEqual(prefix_upper_bound('\ud7ff'), '\ue000')
+        self.assertIsNone(prefix_upper_bound('\U0010ffff'))
+
     def test_post_product(self):
         """
         Test that a POST request to '/' creates a new product
@@ -52,6 +103,90 @@ class TestViews(unittest.TestCase):
                     'message': 'product has been added'})
         self.app.delete('/id/4')
 
+    def test_post_product_duplicate_name(self):
+        """
+        Test that a POST request to '/' with an existing name, in any case, returns a 409 status code
+        """
+        response = self.app.post('/', data={'name': 'TEST PRODUCT1'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.data.decode('utf-8')), {'status': 'error',
+                    'message': 'product already exists'})
+        self.assertEqual(session.query(Products).count(), 3)
+
+    def test_accented_names_ignore_case(self):
+        """
+        Test that names differing only in the case of accented letters are the same product
+        """
+        self.assertEqual(self.app.post('/', data={'name': 'Élan'}).status_code, 201)
+        self.assertEqual(self.app.post('/', data={'name': 'élan'}).status_code, 409)
+        response = self.app.get('/?name=ÉLAN')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['product']['name'], 'Élan')
+
+    def test_put_product_by_name_conflict(self):
+        """
+        Test that renaming a product to the name of another product returns a 409 status code
+        """
+        response = self.app.put('/?name=test+product1', data={'name': 'Test Product2'})
+        self.assertEqual(response.status_code, 409)
+        response = self.app.put('/id/1', data={'name': 'Test Product2'})
+        self.assertEqual(response.status_code, 409)
+        response = self.app.put('/?name=test+product1', data={'name': 'Test Product5'})
+        self.assertEqual(response.status_code, 200)
+        response = self.app.put('/?name=test+product9', data={'name': 'Test Product6'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_bulk_create_products(self):
+        """
+        Test that a POST request to '/bulk' creates many products and reports the existing names
+        """
+        response = self.app.post('/bulk', json={'names': ['Bulk A', 'test product1', 'Bulk B', 'BULK A', '']})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([product['name'] for product in data['created']], ['Bulk A', 'Bulk B'])
+        self.assertEqual([error['index'] for error in data['errors']], [1, 3, 4])
+        self.assertEqual(session.query(Products).filter(Products.name.like('Bulk%')).count(), 2)
+        self.assertEqual(self.app.post('/bulk', json={'names': []}).status_code, 400)
+        self.assertEqual(self.app.post('/bulk', data={'names': 'Bulk C'}).status_code, 400)
+
+    def test_bulk_rename_products(self):
+        """
+        Test that a PUT request to '/bulk' renames many products and reports missing products and conflicts
+        """
+        response = self.app.put('/bulk', json={'products': [
+            {'id': 1, 'new_name': 'Renamed One'},
+            {'name': 'TEST PRODUCT2', 'new_name': 'Renamed Two'},
+            {'id': 3, 'new_name': 'renamed one'},
+            {'id': 99, 'new_name': 'Renamed Three'},
+            {'new_name': 'Renamed Four'},
+            {'id': True, 'new_name': 'Renamed Five'},
+            {'id': 2 ** 70, 'new_name': 'Renamed Six'}
+        ]})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['updated'], 2)
+        self.assertEqual([error['index'] for error in data['errors']], [2, 3, 4, 5, 6])
+        self.assertEqual(data['errors'][0]['message'], 'product [ renamed one ] already exists')
+        names = sorted(product.name for product in session.query(Products))
+        self.assertEqual(names, ['Test Product3', 'renamed one', 'renamed two'])
+
+    def test_bulk_delete_products(self):
+        """
+        Test that a DELETE request to '/bulk' deletes many products and reports the missing ones
+        """
+        response = self.app.delete('/bulk', json={'names': ['test product1', 'Test Product2', 'Nothing']})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['deleted'], 2)
+        self.assertEqual(data['errors'], [{'index': 2, 'message': 'product [ Nothing ] does not exist'}])
+        response = self.app.delete('/bulk', json={'ids': [3, 4]})
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(data['deleted'], 1)
+        self.assertEqual(session.query(Products).filter(Products.name.like('Test Product%')).count(), 0)
+        self.assertEqual(self.app.delete('/bulk', json={'ids': ['x']}).status_code, 400)
+        self.assertEqual(self.app.delete('/bulk', json={'ids': [True]}).status_code, 400)
+        self.assertEqual(self.app.delete('/bulk', json={'ids': [2 ** 70]}).status_code, 400)
+
     def test_post_product_invalid_request(self):
         """
         Test that a POST request to '/' with invalid data returns a 400 status code
@@ -1,16 +1,84 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
-from api.v1.models import Library
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import scoped_session, sessionmaker
+from api.v1.schema import init_schema
+from api.pragmas import configure_sqlite
+from api.cache import LRUCache
+from api.events import EventBus
+from api.compression import compress_response
+from api.utils import format_response
 from flask import Flask
+import os
 """
 Module that acts as base for other modules.
+
+Every request gets its own database session from a thread-local registry,
+backed by the engine's connection pool. The session is closed and its
+connection returned to the pool when the application context ends, so
+concurrent requests on different threads never share a session and a failed
+transaction only affects the request that caused it.
 """
 
 
+DATABASE_URL = os.environ.get('LIBRARY_DATABASE_URL', 'sqlite:///data/library.db')
+POOL_SIZE = int(os.environ.get('LIBRARY_POOL_SIZE', 10))
+POOL_MAX_OVERFLOW = int(os.environ.get('LIBRARY_POOL_MAX_OVERFLOW', 20))
+POOL_TIMEOUT = int(os.environ.get('LIBRARY_POOL_TIMEOUT', 30))
+BOOK_CACHE_SIZE = int(os.environ.get('LIBRARY_BOOK_CACHE_SIZE', 1024))
+BOOK_CACHE_TTL = float(os.environ.get('LIBRARY_BOOK_CACHE_TTL', 60))
+EVENT_QUEUE_SIZE = int(os.environ.get('LIBRARY_EVENT_QUEUE_SIZE', 100))
+ASYNC_VIEWS = os.environ.get('LIBRARY_ASYNC_VIEWS', 'off').lower() in ('on', '1', 'true', 'yes')
+
+
 app = Flask(__name__)
-engine = create_engine("sqlite:///data/library.db")
-Library.metadata.create_all(engine)
-session = Session(engine)
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    connect_args={'check_same_thread': False}
+)
+configure_sqlite(engine)
+init_schema(engine)
+session = scoped_session(sessionmaker(bind=engine))
+book_cache = LRUCache(maxsize=BOOK_CACHE_SIZE, ttl=BOOK_CACHE_TTL)
+book_events = EventBus(maxsize=EVENT_QUEUE_SIZE)
+
+
+@app.teardown_appcontext
+def remove_session(exception=None):
+    """
+    Close the current thread's session at the end of the application context,
+    rolling back anything left uncommitted and returning its connection to the pool.
+    """
+    session.remove()
+
+
+@app.after_request
+def compress(response):
+    """
+    Compress the response when the client accepts a content encoding.
+    """
+    return compress_response(response)
+
+
+@app.errorhandler(OperationalError)
+def database_busy(error):
+    """
+    Answer with 503 Service Unavailable when the database stayed locked for
+    longer than the busy timeout, so the client can retry the request.
+    """
+    if 'database is locked' not in str(error.orig):
+        raise error
+    session.rollback()
+    response, code = format_response(
+        status='error',
+        message='Database busy',
+        code=503,
+        error={'details': 'The database is busy, please retry the request'}
+    )
+    response.headers['Retry-After'] = '1'
+    return response, code
 
 
 from api.v1.routes import library_v1
@@ -20,3 +88,13 @@ Register the blueprint for versioned routes
 
 
 app.register_blueprint(library_v1)
+
+
+if ASYNC_VIEWS:
+    from api.v1.async_routes import async_views, run_in_event_loop
+    """
+    Serve the read routes with their async views, all run on one event loop
+    """
+    app.async_to_sync = run_in_event_loop
+    for endpoint, view in async_views.items():
+        app.view_functions[f'{library_v1.name}.{endpoint}'] = view
@@ -0,0 +1,142 @@
+from collections import OrderedDict
+import threading
+import time
+"""
+This module provides a small in-process cache for API lookups.
+
+The cache is a thread-safe LRU mapping with an optional time to live. Writers
+invalidate entries after they commit, and readers pass the generation they
+saw before querying the database to set(), so a value read before an
+invalidation can never be stored after it.
+
+Writers in other processes cannot invalidate the entries of this one, so a
+cache can also follow a version of the source data, such as a database-wide
+change counter: sync() clears the cache whenever the version has moved on.
+"""
+
+
+class LRUCache:
+    """
+    A bounded, thread-safe least-recently-used cache with a time to live.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        """
+        Create an empty cache.
+
+        Args:
+            maxsize (int): The most entries kept; 0 disables the cache.
+            ttl (float): Seconds an entry stays valid, or None to keep it until evicted.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def generation(self):
+        """
+        Return the current generation, to be passed to set() after a lookup.
+        """
+        with self._lock:
+            return self._generation
+
+    def sync(self, version):
+        """
+        Clear the cache if the source data changed since the last call.
+
+        Call it before every lookup, with the version read before the
+        values that may be stored.
+
+        Args:
+            version (int): A version of the source data that grows with
+                every change, or None if there is none to follow.
+
+        Returns:
+            int or None: The generation to pass to set() with the values
+            read after the version, or None if the version is older than
+            the one the cache already follows, so those values must not be
+            stored.
+        """
+        with self._lock:
+            if version is not None and self._version is not None and version < self._version:
+                return None
+            if version is not None and version != self._version:
+                self._version = version
+                self._generation += 1
+                self._entries.clear()
+            return self._generation
+
+    def get(self, key):
+        """
+        Return the cached value for the key, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, generation=None):
+        """
+        Store a value, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key: The key of the value.
+            value: The value to cache.
+            generation (int): The generation returned by generation() before
+                the value was read. The value is dropped if an invalidation
+                happened since.
+        """
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        """
+        Remove the given keys from the cache.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Return the size and the hit, miss and eviction counters of the cache.
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,181 @@
+from flask import request
+from api.cache import LRUCache
+import gzip
+import os
+import zlib
+try:
+    import brotli
+except ImportError:
+    brotli = None
+"""
+This module compresses API responses for the clients that accept it.
+
+The encoding is negotiated through the Accept-Encoding request header:
+brotli ('br') is preferred when the brotli package is installed, and gzip is
+used otherwise. Responses smaller than COMPRESSION_MIN_SIZE are sent as they
+are, streamed responses (the exports) are compressed chunk by chunk as they
+are produced, and Server-Sent Events are never compressed so events are not
+held back in the compressor's buffer.
+
+A compressed representation gets its own entity tag, the tag of the
+uncompressed one with a '-gzip' or '-br' suffix, and the compressed bodies
+of responses that carry an entity tag are kept in an LRU cache, so an
+unchanged listing or export is compressed only once.
+
+LIBRARY_COMPRESSION=off turns compression off.
+"""
+
+
+COMPRESSION_ENABLED = os.environ.get('LIBRARY_COMPRESSION', 'on').lower() not in ('off', '0', 'false', 'no')
+COMPRESSION_MIN_SIZE = int(os.environ.get('LIBRARY_COMPRESSION_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('LIBRARY_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('LIBRARY_BROTLI_QUALITY', 5))
+COMPRESSED_CACHE_SIZE = int(os.environ.get('LIBRARY_COMPRESSED_CACHE_SIZE', 32))
+COMPRESSED_CACHE_MAX_BYTES = int(os.environ.get('LIBRARY_COMPRESSED_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'application/msgpack', 'application/cbor'}
+
+CONTENT_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+compressed_cache = LRUCache(maxsize=COMPRESSED_CACHE_SIZE)
+
+
+def etag_variants(etag):
+    """
+    List the entity tags of every encoding of a representation.
+
+    Args:
+        etag (str): The entity tag of the uncompressed representation.
+
+    Returns:
+        list: The tag itself followed by the tag of each content encoding.
+    """
+    return [etag] + [f'{etag}-{encoding}' for encoding in CONTENT_ENCODINGS]
+
+
+def negotiate_encoding():
+    """
+    Choose the content encoding of the current response.
+
+    Returns:
+        str or None: 'br' or 'gzip', or None if the client accepts neither.
+    """
+    return request.accept_encodings.best_match(CONTENT_ENCODINGS)
+
+
+def compress(data, encoding):
+    """
+    Compress a whole response body.
+
+    Args:
+        data (bytes): The body to compress.
+        encoding (str): 'br' or 'gzip'.
+
+    Returns:
+        bytes: The compressed body.
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(chunks, encoding, cache_key=None):
+    """
+    Lazily compress the chunks of a streamed response.
+
+    When a cache key is given and the whole compressed body fits in
+    COMPRESSED_CACHE_MAX_BYTES, it is stored in the compressed cache once the
+    stream has been fully sent. Entries are never invalidated: a changed
+    representation has a new entity tag, and so a new key.
+
+    Args:
+        chunks (iterable): The chunks of the uncompressed body.
+        encoding (str): 'br' or 'gzip'.
+        cache_key (tuple): The key to cache the compressed body under, or None.
+
+    Yields:
+        bytes: Chunks of the compressed body.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+    sent = [] if cache_key is not None else None
+    size = 0
+    try:
+        for chunk in chunks:
+            output = process(chunk)
+            if output:
+                size += len(output)
+                if sent is not None and size <= COMPRESSED_CACHE_MAX_BYTES:
+                    sent.append(output)
+                else:
+                    sent = None
+                yield output
+        output = finish()
+        if sent is not None and size + len(output) <= COMPRESSED_CACHE_MAX_BYTES:
+            compressed_cache.set(cache_key, b''.join(sent) + output)
+        yield output
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response):
+    """
+    Compress a response for the current request when the client accepts it.
+
+    Only successful JSON, NDJSON, MessagePack and CBOR responses are
+    compressed; responses that are already encoded or smaller than
+    COMPRESSION_MIN_SIZE are left as they are. Every response that could
+    have been compressed gets 'Vary: Accept-Encoding', and so does a 304,
+    which must carry the Vary of the 200 it stands for. A 304 answering a
+    request for a compressed representation carries that representation's
+    entity tag.
+
+    Args:
+        response (Response): The response about to be sent.
+
+    Returns:
+        Response: The response, compressed if possible.
+    """
+    if not COMPRESSION_ENABLED:
+        return response
+    etag = response.get_etag()[0]
+    if response.status_code == 304:
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding()
+        if etag is not None and encoding is not None and request.if_none_match.contains_weak(f'{etag}-{encoding}'):
+            response.set_etag(f'{etag}-{encoding}')
+        return response
+    if response.status_code != 200 or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    if 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+    cache_key = (request.path, etag, encoding) if etag is not None else None
+    body = compressed_cache.get(cache_key) if cache_key is not None else None
+    if response.is_streamed:
+        if body is None:
+            response.response = compress_stream(response.response, encoding, cache_key)
+            response.headers.pop('Content-Length', None)
+        else:
+            if hasattr(response.response, 'close'):
+                response.response.close()
+            response.set_data(body)
+    else:
+        if body is None:
+            data = response.get_data()
+            if len(data) < COMPRESSION_MIN_SIZE:
+                return response
+            body = compress(data, encoding)
+            if cache_key is not None:
+                compressed_cache.set(cache_key, body)
+        response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    if etag is not None:
+        response.set_etag(f'{etag}-{encoding}')
+    return response
@@ -0,0 +1,114 @@
+import itertools
+import queue
+import threading
+"""
+This module provides an in-process publish/subscribe bus for book events.
+
+Every subscriber gets its own bounded queue. Publishing never blocks: when a
+subscriber falls behind and its queue is full, its oldest event is dropped to
+make room, so one slow client can neither stall the writers nor make memory
+grow without bound. Events only reach subscribers in the same process,
+unless a relay is set: it is handed every event published here, to carry
+it to the buses of other processes, which deliver() it to their own
+subscribers.
+"""
+
+
+class EventBus:
+    """
+    A thread-safe fan-out of events to bounded subscriber queues.
+    """
+
+    def __init__(self, maxsize=100):
+        """
+        Create a bus without subscribers.
+
+        Args:
+            maxsize (int): The most events queued for a single subscriber.
+        """
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.relay = None
+        self._subscribers = {}
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self, notify=None):
+        """
+        Register a new subscriber.
+
+        Args:
+            notify (callable): Called without arguments, on the publishing
+                thread, after each event is queued for the subscriber, so a
+                subscriber running on an event loop can be woken up instead
+                of blocking a thread on the queue.
+
+        Returns:
+            Queue: The queue the subscriber's events are delivered to.
+        """
+        subscriber = queue.Queue(maxsize=self.maxsize)
+        with self._lock:
+            self._subscribers[subscriber] = notify
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """
+        Remove a subscriber returned by subscribe().
+        """
+        with self._lock:
+            self._subscribers.pop(subscriber, None)
+
+    def publish(self, event_type, data):
+        """
+        Deliver an event to every subscriber, and hand it to the relay if
+        one is set.
+
+        Args:
+            event_type (str): The name of the event, such as 'book.created'.
+            data (dict): The JSON-serializable payload of the event.
+
+        Returns:
+            dict: The event, with its sequence number.
+        """
+        event = self.deliver(event_type, data)
+        if self.relay is not None:
+            self.relay(event_type, data)
+        return event
+
+    def deliver(self, event_type, data):
+        """
+        Deliver an event to every subscriber of this bus only, such as an
+        event relayed from another process.
+
+        Args:
+            event_type (str): The name of the event, such as 'book.created'.
+            data (dict): The JSON-serializable payload of the event.
+
+        Returns:
+            dict: The event, with its sequence number.
+        """
+        with self._lock:
+            event = {'id': next(self._sequence), 'type': event_type, 'data': data}
+            subscribers = list(self._subscribers.items())
+        for subscriber, notify in subscribers:
+            while True:
+                try:
+                    subscriber.put_nowait(event)
+                    break
+                except queue.Full:
+                    try:
+                        subscriber.get_nowait()
+                        with self._lock:
+                            self.dropped += 1
+                    except queue.Empty:
+                        pass
+            if notify is not None:
+                notify()
+        return event
+
+    def subscriber_count(self):
+        """
+        Return the number of current subscribers.
+        """
+        with self._lock:
+            return len(self._subscribers)
@@ -0,0 +1,68 @@
+from sqlalchemy import event
+import os
+"""
+This module tunes SQLite connections for a read-heavy web workload.
+
+The pragmas are applied to every new DBAPI connection through an engine
+'connect' event, so they hold for each connection in the pool:
+
+- journal_mode=WAL lets readers keep reading while a writer commits.
+- synchronous=NORMAL only syncs the WAL at checkpoints, which is safe in WAL mode.
+- busy_timeout makes a connection wait for a lock instead of failing at once.
+- cache_size, mmap_size and temp_store keep hot pages and temporary
+  structures in memory.
+
+Each pragma can be overridden with a LIBRARY_SQLITE_<NAME> environment
+variable, and LIBRARY_SQLITE_TUNING=off disables the tuning entirely.
+"""
+
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY'
+}
+
+
+def load_pragmas():
+    """
+    Build the pragma settings from the defaults and the environment.
+
+    Returns:
+        dict: The pragmas to apply, or an empty dict if tuning is disabled.
+    """
+    if os.environ.get('LIBRARY_SQLITE_TUNING', 'on').lower() in ('0', 'off', 'false', 'no'):
+        return {}
+    return {
+        name: os.environ.get(f'LIBRARY_SQLITE_{name.upper()}', value)
+        for name, value in DEFAULT_PRAGMAS.items()
+    }
+
+
+def configure_sqlite(engine, pragmas=None):
+    """
+    Apply the pragmas to every connection the engine opens.
+
+    Args:
+        engine (Engine): The engine to configure. Non-SQLite engines are left untouched.
+        pragmas (dict): The pragmas to apply. Defaults to load_pragmas().
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    if pragmas is None:
+        pragmas = load_pragmas()
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        """
+        Run the PRAGMA statements on a newly opened connection.
+        """
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
@@ -0,0 +1,78 @@
+from api.cache import LRUCache
+import json
+import os
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+"""
+This module selects the JSON encoder used for API responses.
+
+orjson is used when it is installed, and the standard library encoder
+otherwise. LIBRARY_JSON_SERIALIZER=json forces the standard library encoder.
+
+It also holds the fragment cache: the encoded JSON of individual books,
+keyed by id and stored with the updated_at they were rendered from, so
+listings can be assembled from ready-made bytes and a book is only encoded
+again once it has changed.
+
+Clients may also ask for a binary encoding of the same envelope through the
+Accept header: MessagePack ('application/msgpack') when msgpack is
+installed, and CBOR ('application/cbor') when cbor2 is installed.
+"""
+
+
+def _stdlib_dumps(obj):
+    """
+    Encode an object to compact JSON bytes with the standard library.
+    """
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def _orjson_dumps(obj):
+    """
+    Encode an object to compact JSON bytes with orjson.
+    """
+    return orjson.dumps(obj)
+
+
+SERIALIZERS = {'json': _stdlib_dumps}
+if orjson is not None:
+    SERIALIZERS['orjson'] = _orjson_dumps
+
+SERIALIZER = os.environ.get('LIBRARY_JSON_SERIALIZER', 'orjson' if orjson is not None else 'json')
+if SERIALIZER not in SERIALIZERS:
+    raise ValueError(f'Unknown or unavailable JSON serializer: {SERIALIZER}')
+dumps = SERIALIZERS[SERIALIZER]
+
+FRAGMENT_CACHE_SIZE = int(os.environ.get('LIBRARY_FRAGMENT_CACHE_SIZE', 10000))
+fragment_cache = LRUCache(maxsize=FRAGMENT_CACHE_SIZE)
+
+
+def _msgpack_dumps(obj):
+    """
+    Encode an object to MessagePack bytes.
+    """
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def _cbor_dumps(obj):
+    """
+    Encode an object to CBOR bytes.
+    """
+    return cbor2.dumps(obj)
+
+
+BINARY_SERIALIZERS = {}
+if msgpack is not None:
+    BINARY_SERIALIZERS['application/msgpack'] = _msgpack_dumps
+if cbor2 is not None:
+    BINARY_SERIALIZERS['application/cbor'] = _cbor_dumps
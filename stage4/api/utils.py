@@ -1,4 +1,12 @@
-from flask import jsonify
+from flask import request, Response, has_request_context
+from api.serializers import dumps, fragment_cache, BINARY_SERIALIZERS
+from api.compression import etag_variants
+from api.v1.models import AVAILABILITY_STATUSES, BOOK_FACETS
+from datetime import date, datetime, timezone
+import base64
+import binascii
+import hashlib
+import json
 """
 This module provides utility functions for the API.
 
@@ -7,6 +15,46 @@ consistent and correct behavior throughout the application.
 """
 
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+BULK_BATCH_SIZE = 500
+MAX_BULK_BATCH_SIZE = 5000
+# The range of a SQLite INTEGER, which book ids must fit in
+BOOK_ID_RANGE = (-2 ** 63, 2 ** 63 - 1)
+BOOK_FILTERS = ('title', 'author', 'genre', 'availability_status')
+BOOK_COLUMNS = (
+    'id',
+    'title',
+    'author',
+    'genre',
+    'description',
+    'publication_date',
+    'availability_status',
+    'edition',
+    'summary',
+    'created_at',
+    'updated_at'
+)
+EXPORT_BATCH_SIZE = 500
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json'
+}
+
+
+BOOK_FIELDS = (
+    'title',
+    'author',
+    'genre',
+    'description',
+    'publication_date',
+    'availability_status',
+    'edition',
+    'summary'
+)
+BOOK_TEXT_FIELDS = tuple(key for key in BOOK_FIELDS if key not in ('publication_date', 'availability_status'))
+
+
 def validate_book_data(data):
     """
     Validate that the JSON data contains all the necessary keys.
@@ -17,59 +65,737 @@ def validate_book_data(data):
     Returns:
         list: A list of missing keys if the data does not validate, otherwise an empty list.
     """
-    required_keys = [
-        'title',
-        'author',
-        'genre',
-        'description',
-        'publication_date',
-        'availability_status',
-        'edition',
-        'summary'
-    ]
-    missing_keys = [key for key in required_keys if key not in data.keys()]
+    missing_keys = [key for key in BOOK_FIELDS if key not in data.keys()]
     return missing_keys
 
 
-def format_books_list(books_list: list):
+def parse_date(value):
+    """
+    Parse a date in the YYYY-MM-DD format.
+
+    Args:
+        value (str): The date.
+
+    Returns:
+        date: The parsed date.
+
+    Raises:
+        ValueError: If the value is not a date in the YYYY-MM-DD format.
+    """
+    if not isinstance(value, str):
+        raise ValueError(f'Invalid date: {value!r}, expected YYYY-MM-DD')
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_status(value):
+    """
+    Check that an availability status is one of AVAILABILITY_STATUSES.
+
+    Args:
+        value (str): The availability status.
+
+    Returns:
+        str: The availability status.
+
+    Raises:
+        ValueError: If the status is unknown.
+    """
+    if value not in AVAILABILITY_STATUSES:
+        raise ValueError(f'Invalid availability_status: {value!r}, expected one of {list(AVAILABILITY_STATUSES)}')
+    return value
+
+
+def is_book_id(value):
+    """
+    Check that a value decoded from JSON is a book id.
+
+    Args:
+        value: The value to check.
+
+    Returns:
+        bool: True for an integer, not a boolean, in BOOK_ID_RANGE.
+    """
+    return type(value) is int and BOOK_ID_RANGE[0] <= value <= BOOK_ID_RANGE[1]
+
+
+def parse_text(key, value):
+    """
+    Check that a text field of a book is a string.
+
+    Args:
+        key (str): The name of the field.
+        value: The value of the field.
+
+    Returns:
+        str: The value.
+
+    Raises:
+        ValueError: If the value is null or not a string.
+    """
+    if not isinstance(value, str):
+        raise ValueError(f'Invalid {key}: {value!r}, expected a string')
+    return value
+
+
+def parse_book_data(data):
+    """
+    Convert validated JSON data into the column values of a book.
+
+    Args:
+        data (dict): JSON data that passed validate_book_data.
+
+    Returns:
+        dict: The column values of the book.
+
+    Raises:
+        ValueError: If a text field is not a string, the publication date is
+            not in the YYYY-MM-DD format or the availability status is unknown.
+    """
+    return {
+        'title': parse_text('title', data['title']),
+        'author': parse_text('author', data['author']),
+        'genre': parse_text('genre', data['genre']),
+        'description': parse_text('description', data['description']),
+        'publication_date': parse_date(data['publication_date']),
+        'availability_status': parse_status(data['availability_status']),
+        'edition': parse_text('edition', data['edition']),
+        'summary': parse_text('summary', data['summary'])
+    }
+
+
+def parse_book_updates(data):
+    """
+    Convert a partial set of book fields into column values.
+
+    Args:
+        data (dict): JSON data with any of the book fields.
+
+    Returns:
+        dict: The column values to update.
+
+    Raises:
+        ValueError: If there are no fields, an unknown field, a text field
+            that is not a string, the publication date is not in the
+            YYYY-MM-DD format or the status is unknown.
+    """
+    if not isinstance(data, dict) or not data:
+        raise ValueError('Expected an object with the fields to update')
+    unknown_keys = [key for key in data if key not in BOOK_FIELDS]
+    if unknown_keys:
+        raise ValueError(f'Unknown fields: {unknown_keys}')
+    values = dict(data)
+    for key in BOOK_TEXT_FIELDS:
+        if key in values:
+            parse_text(key, values[key])
+    if 'publication_date' in values:
+        values['publication_date'] = parse_date(values['publication_date'])
+    if 'availability_status' in values:
+        parse_status(values['availability_status'])
+    return values
+
+
+def parse_book_selection(data):
+    """
+    Parse the books selected by a bulk request.
+
+    Books are selected either by a list of ids ('ids') or by exact matches on
+    the filter columns ('filter'). An empty selection is refused, so a bulk
+    request can never touch every book by accident.
+
+    Args:
+        data (dict): The JSON body of the request.
+
+    Returns:
+        tuple: The list of ids (or None) and the dict of filters (or None).
+
+    Raises:
+        ValueError: If the selection is missing or malformed.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    ids = data.get('ids')
+    filters = data.get('filter')
+    if (ids is None) == (filters is None):
+        raise ValueError("Select the books with either 'ids' or 'filter'")
+    if ids is not None:
+        if not isinstance(ids, list) or not ids or not all(is_book_id(i) for i in ids):
+            raise ValueError("'ids' must be a non-empty list of book ids")
+        return ids, None
+    if not isinstance(filters, dict) or not filters:
+        raise ValueError(f"'filter' must be a non-empty object with keys from {list(BOOK_FILTERS)}")
+    unknown_keys = [key for key in filters if key not in BOOK_FILTERS]
+    if unknown_keys:
+        raise ValueError(f'Unknown filters: {unknown_keys}')
+    return None, parse_book_filters(filters)
+
+
+def parse_batch_size(value):
+    """
+    Parse the number of rows to insert per statement in a bulk request.
+
+    Args:
+        value (str or None): The raw value of the 'batch_size' query parameter.
+
+    Returns:
+        int: The batch size, capped at MAX_BULK_BATCH_SIZE.
+
+    Raises:
+        ValueError: If the value is not a positive integer.
+    """
+    if value is None:
+        return BULK_BATCH_SIZE
+    try:
+        batch_size = int(value)
+    except ValueError:
+        raise ValueError('batch_size must be a positive integer')
+    if batch_size < 1:
+        raise ValueError('batch_size must be a positive integer')
+    return min(batch_size, MAX_BULK_BATCH_SIZE)
+
+
+def read_ndjson(stream):
+    """
+    Lazily decode a stream of newline-delimited JSON.
+
+    Args:
+        stream (file-like): A binary stream with one JSON document per line.
+
+    Yields:
+        object: The decoded document of each non-blank line, or the
+        ValueError raised while decoding it.
+    """
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield e
+
+
+def format_timestamp(value):
+    """
+    Format a naive UTC timestamp as returned by the API.
+
+    Args:
+        value (datetime): The timestamp.
+
+    Returns:
+        str: The timestamp in ISO 8601 format with microseconds and a 'Z' suffix.
+    """
+    return value.isoformat(timespec='microseconds') + 'Z'
+
+
+FIELD_FORMATTERS = {
+    'publication_date': date.isoformat,
+    'created_at': format_timestamp,
+    'updated_at': format_timestamp
+}
+
+
+def format_book(book, fields=None):
+    """
+    Format a single Books object (or a row with the same columns) into a
+    dictionary that can be directly converted to JSON.
+
+    Args:
+        book (Books): A Books object or a result row of the books table.
+        fields (tuple): The columns to include, or None for all of them.
+
+    Returns:
+        dict: The formatted book.
+    """
+    if fields is not None:
+        formatted = {}
+        for field in fields:
+            value = getattr(book, field)
+            formatted[field] = FIELD_FORMATTERS[field](value) if field in FIELD_FORMATTERS else value
+        return formatted
+    return {
+        'id': book.id,
+        'title': book.title,
+        'author': book.author,
+        'genre': book.genre,
+        'description': book.description,
+        'publication_date': book.publication_date.isoformat(),
+        'availability_status': book.availability_status,
+        'edition': book.edition,
+        'summary': book.summary,
+        'created_at': format_timestamp(book.created_at),
+        'updated_at': format_timestamp(book.updated_at)
+    }
+
+
+def format_books_list(books_list: list, fields=None):
     """
     Format a list of Books objects into a list of dictionaries that can be directly
     converted to JSON.
 
+    Books that are already formatted as dictionaries are passed through unchanged.
+
     Args:
         books_list (list): A list of Books objects.
+        fields (tuple): The columns to include, or None for all of them.
 
     Returns:
         list: A list of dictionaries.
     """
-    formatted_books = []
-    for book in books_list:
-        formatted_books.append({
-            'id': book.id,
-            'title': book.title,
-            'author': book.author,
-            'genre': book.genre,
-            'description': book.description,
-            'publication_date': book.publication_date,
-            'availability_status': book.availability_status,
-            'edition': book.edition,
-            'summary': book.summary,
-            'created_at': book.created_at,
-            'updated_at': book.updated_at
-        })
-    return formatted_books
-
-
-def format_response(data=None, status='success', message='', code=200, error=None):
+    return [book if isinstance(book, dict) else format_book(book, fields) for book in books_list]
+
+
+def render_book(book):
+    """
+    Encode a single book to JSON bytes.
+
+    The encoding of a Books object is kept in the fragment cache and reused
+    for as long as the book's updated_at is unchanged. Books that are already
+    formatted as dictionaries are encoded directly.
+
+    Args:
+        book (Books or dict): The book to encode.
+
+    Returns:
+        bytes: The JSON encoding of the book.
+    """
+    if isinstance(book, dict):
+        return dumps(book)
+    cached = fragment_cache.get(book.id)
+    if cached is not None and cached[0] == book.updated_at:
+        return cached[1]
+    fragment = dumps(format_book(book))
+    fragment_cache.set(book.id, (book.updated_at, fragment))
+    return fragment
+
+
+def stream_books(rows, export_format='ndjson', fields=None):
+    """
+    Lazily encode book rows for a streamed export.
+
+    Args:
+        rows (iterable): Book rows, fetched in batches by the caller.
+        export_format (str): 'ndjson' for one JSON object per line, or 'json'
+            for a single JSON array written incrementally.
+        fields (tuple): The columns to include, or None for all of them.
+
+    Yields:
+        bytes: Chunks of the encoded export.
+    """
+    if export_format == 'ndjson':
+        for row in rows:
+            yield dumps(format_book(row, fields)) + b'\n'
+        return
+    yield b'['
+    separator = b''
+    for row in rows:
+        yield separator + dumps(format_book(row, fields))
+        separator = b','
+    yield b']'
+
+
+def parse_page_size(value):
+    """
+    Parse the page size requested by the client.
+
+    Args:
+        value (str or None): The raw value of the 'limit' query parameter.
+
+    Returns:
+        int: The page size, capped at MAX_PAGE_SIZE.
+
+    Raises:
+        ValueError: If the value is not a positive integer.
+    """
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('limit must be a positive integer')
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_offset(value):
+    """
+    Parse the number of results to skip.
+
+    Args:
+        value (str or None): The raw value of the 'offset' query parameter.
+
+    Returns:
+        int: The offset, 0 when none was given.
+
+    Raises:
+        ValueError: If the value is not a non-negative integer.
+    """
+    if value is None:
+        return 0
+    try:
+        offset = int(value)
+    except ValueError:
+        raise ValueError('offset must be a non-negative integer')
+    if offset < 0:
+        raise ValueError('offset must be a non-negative integer')
+    return offset
+
+
+def build_match_query(terms):
+    """
+    Turn free text into an FTS5 MATCH expression.
+
+    Every word is quoted, so characters with a meaning in the FTS5 query
+    syntax are matched literally, and a book must contain all the words.
+
+    Args:
+        terms (str): The text the user searched for.
+
+    Returns:
+        str: The MATCH expression, or an empty string when there are no words.
+    """
+    words = terms.split()
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+def parse_fields(value):
+    """
+    Parse the sparse fieldset requested by the client.
+
+    Args:
+        value (str or None): The raw value of the 'fields' query parameter, a
+            comma-separated list of book columns.
+
+    Returns:
+        tuple or None: The columns to return, always starting with 'id', or
+        None when every column was requested.
+
+    Raises:
+        ValueError: If a column does not exist.
+    """
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown_fields = [field for field in fields if field not in BOOK_COLUMNS]
+    if unknown_fields:
+        raise ValueError(f'Unknown fields: {unknown_fields}')
+    return tuple(field for field in BOOK_COLUMNS if field == 'id' or field in fields)
+
+
+def parse_facets(value):
+    """
+    Parse the facets requested by the client.
+
+    Args:
+        value (str or None): The raw value of the 'facets' query parameter, a
+            comma-separated list of facets.
+
+    Returns:
+        tuple: The facets to count, in the order of BOOK_FACETS; every facet
+        when none was requested.
+
+    Raises:
+        ValueError: If a facet does not exist.
+    """
+    if not value:
+        return BOOK_FACETS
+    facets = [facet.strip() for facet in value.split(',') if facet.strip()]
+    unknown_facets = [facet for facet in facets if facet not in BOOK_FACETS]
+    if unknown_facets:
+        raise ValueError(f'Unknown facets: {unknown_facets}')
+    return tuple(facet for facet in BOOK_FACETS if facet in facets)
+
+
+def parse_book_ids(value):
+    """
+    Parse the ids of the books requested in a batch.
+
+    Args:
+        value (str or list): A comma-separated string of ids, or a list of ids.
+
+    Returns:
+        list: The distinct ids in the order they were requested.
+
+    Raises:
+        ValueError: If an id is not an integer, or there are no ids or more than MAX_PAGE_SIZE.
+    """
+    if isinstance(value, str):
+        value = [book_id.strip() for book_id in value.split(',') if book_id.strip()]
+    if not isinstance(value, list) or not value:
+        raise ValueError('Expected a non-empty list of book ids')
+    if any(isinstance(book_id, bool) or not isinstance(book_id, (int, str)) for book_id in value):
+        raise ValueError('Invalid book id')
+    try:
+        ids = list(dict.fromkeys(int(book_id) for book_id in value))
+    except ValueError:
+        raise ValueError('Invalid book id')
+    if not all(is_book_id(book_id) for book_id in ids):
+        raise ValueError('Invalid book id')
+    if len(ids) > MAX_PAGE_SIZE:
+        raise ValueError(f'At most {MAX_PAGE_SIZE} books can be requested at once')
+    return ids
+
+
+def parse_book_filters(args):
+    """
+    Collect the book filters present in the query parameters.
+
+    Args:
+        args (dict): The query parameters of the request.
+
+    Returns:
+        dict: The column names from BOOK_FILTERS mapped to the values to match.
+
+    Raises:
+        ValueError: If a filter is not a string or the availability status
+            filter is unknown.
+    """
+    filters = {key: parse_text(key, args[key]) for key in BOOK_FILTERS if key in args}
+    if 'availability_status' in filters:
+        parse_status(filters['availability_status'])
+    return filters
+
+
+def parse_publication_range(args):
+    """
+    Parse the publication date range in the query parameters.
+
+    Args:
+        args (dict): The query parameters of the request, where
+            'published_from' and 'published_to' are inclusive YYYY-MM-DD bounds.
+
+    Returns:
+        tuple: The lower and upper bound, each a date or None.
+
+    Raises:
+        ValueError: If a bound is not a date in the YYYY-MM-DD format.
+    """
+    start = args.get('published_from')
+    end = args.get('published_to')
+    return (parse_date(start) if start else None, parse_date(end) if end else None)
+
+
+def encode_cursor(book_id, change_seq=None):
+    """
+    Encode the position of the last book on a page into an opaque cursor.
+
+    Args:
+        book_id (int): The id of the last book returned.
+        change_seq (int): The change_seq of the last change returned, for
+            cursors of the change feed.
+
+    Returns:
+        str: A URL-safe cursor string.
+    """
+    position = {'id': book_id}
+    if change_seq is not None:
+        position['seq'] = change_seq
+    payload = json.dumps(position, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def load_cursor(cursor):
+    """
+    Decode the position stored in a cursor produced by encode_cursor.
+
+    Args:
+        cursor (str): The cursor.
+
+    Returns:
+        dict: The position, with at least an integer 'id'.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded))
+        book_id = position['id']
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(book_id, int):
+        raise ValueError('Invalid cursor')
+    return position
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Args:
+        cursor (str or None): The raw value of the 'after' query parameter.
+
+    Returns:
+        int or None: The id to continue after, or None when no cursor was given.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    if not cursor:
+        return None
+    return load_cursor(cursor)['id']
+
+
+def decode_change_cursor(cursor):
+    """
+    Decode a change feed cursor produced by encode_cursor.
+
+    Cursors from before the change sequence, which held a timestamp, are
+    refused: the client has to sync again from the beginning.
+
+    Args:
+        cursor (str or None): The raw value of the 'since' query parameter.
+
+    Returns:
+        int or None: The change_seq to continue after, or None when no
+        cursor was given.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    if not cursor:
+        return None
+    change_seq = load_cursor(cursor).get('seq')
+    if not isinstance(change_seq, int):
+        raise ValueError('Invalid cursor')
+    return change_seq
+
+
+def parse_timestamp(value):
+    """
+    Parse a timestamp stored on a book into an aware UTC datetime.
+
+    Args:
+        value (str): An ISO 8601 timestamp, such as the book's updated_at.
+
+    Returns:
+        datetime: The timestamp in UTC.
+
+    Raises:
+        ValueError: If the value is not an ISO 8601 timestamp.
+    """
+    if not isinstance(value, str):
+        raise ValueError(f'Invalid timestamp: {value!r}')
+    return datetime.fromisoformat(value.rstrip('Z')).replace(tzinfo=timezone.utc)
+
+
+def negotiate_mimetype():
+    """
+    Choose the media type of the current response from the Accept header.
+
+    JSON is returned unless the client prefers one of the available binary
+    encodings, so clients that accept anything keep getting JSON.
+
+    Returns:
+        str: 'application/json' or a key of BINARY_SERIALIZERS.
+    """
+    if not BINARY_SERIALIZERS or not has_request_context():
+        return 'application/json'
+    return request.accept_mimetypes.best_match(('application/json', *BINARY_SERIALIZERS), 'application/json')
+
+
+def compute_etag(books, *parts):
+    """
+    Compute a strong entity tag for a response made of books.
+
+    The tag is derived from the id and updated_at of every book, and from any
+    other parts that change the representation (such as the next cursor), so
+    it changes whenever a book in the response is added, removed or updated.
+    Binary encodings of a response get a tag of their own.
+
+    Args:
+        books (list): The Books objects (or formatted books) in the response.
+        *parts: Other values the response depends on.
+
+    Returns:
+        str: The entity tag, without quotes.
+    """
+    digest = hashlib.sha1()
+    mimetype = negotiate_mimetype()
+    if mimetype != 'application/json':
+        digest.update(mimetype.encode())
+    for part in parts:
+        digest.update(repr(part).encode())
+    for book in books:
+        if isinstance(book, dict):
+            digest.update(f"{book['id']}:{book['updated_at']};".encode())
+        else:
+            digest.update(f'{book.id}:{book.updated_at};'.encode())
+    return digest.hexdigest()
+
+
+def is_not_modified(etag, last_modified=None):
+    """
+    Check the conditional headers of the current request.
+
+    If-None-Match takes precedence over If-Modified-Since, as required by
+    RFC 9110; If-Modified-Since is only checked when a last_modified time is given.
+    The tags of the compressed representations match as well.
+
+    Args:
+        etag (str): The entity tag of the current representation.
+        last_modified (datetime): When the representation last changed.
+
+    Returns:
+        bool: True if the client's copy is still current.
+    """
+    if request.if_none_match:
+        return any(request.if_none_match.contains_weak(tag) for tag in etag_variants(etag))
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def not_modified_response(etag, last_modified=None):
+    """
+    Build a 304 Not Modified response, without a body.
+
+    Args:
+        etag (str): The entity tag of the current representation.
+        last_modified (datetime): When the representation last changed.
+
+    Returns:
+        tuple: The empty response and the HTTP status code.
+    """
+    response = Response(status=304)
+    return add_validators((response, 304), etag, last_modified)
+
+
+def add_validators(response, etag, last_modified=None):
+    """
+    Attach the validators of a representation to a response.
+
+    Args:
+        response (tuple): A response and HTTP status code, as returned by format_response.
+        etag (str): The entity tag of the representation.
+        last_modified (datetime): When the representation last changed.
+
+    Returns:
+        tuple: The same response and HTTP status code.
+    """
+    response[0].set_etag(etag)
+    if last_modified is not None:
+        response[0].last_modified = last_modified
+    response[0].cache_control.no_cache = True
+    return response
+
+
+def format_response(data=None, status='success', message='', code=200, error=None, extra=None):
     """
     Format a response into a JSON response.
 
+    The books are rendered one by one with render_book and joined into the
+    encoded envelope, so unchanged books are not encoded again.
+
+    When the client prefers a binary media type from BINARY_SERIALIZERS in
+    its Accept header, the same envelope is encoded in that format instead.
+
     Args:
         data (dict or list): The data to be returned.
         status (str): The status of the response.
         message (str): An optional message for the response.
         code (int): The HTTP status code to return.
         error (dict): An optional error dictionary.
+        extra (dict): Optional keys to return alongside the books in the data object.
 
     Returns:
         tuple: A JSON response of the formatted data and the HTTP status code.
@@ -79,8 +805,42 @@ def format_response(data=None, status='success', message='', code=200, error=Non
         'message': message,
         'http_code': code
     }
-    if data is not None:
-        response['data'] = {'books': format_books_list(data)}
     if error is not None:
         response['error'] = error
-    return jsonify(response), code
\ No newline at end of file
+    mimetype = negotiate_mimetype()
+    if mimetype != 'application/json':
+        if data is not None or extra is not None:
+            response['data'] = {}
+            if data is not None:
+                response['data']['books'] = format_books_list(data)
+            if extra:
+                response['data'].update(extra)
+        return envelope_response(BINARY_SERIALIZERS[mimetype](response), mimetype), code
+    body = [dumps(response)[:-1]]
+    if data is not None or extra is not None:
+        members = []
+        if data is not None:
+            members.append(b'"books":[' + b','.join(render_book(book) for book in data) + b']')
+        if extra:
+            members.append(dumps(extra)[1:-1])
+        body.append(b',"data":{' + b','.join(members) + b'}')
+    body.append(b'}')
+    return envelope_response(b''.join(body), 'application/json'), code
+
+
+def envelope_response(body, mimetype):
+    """
+    Wrap an encoded envelope in a response.
+
+    Args:
+        body (bytes): The encoded envelope.
+        mimetype (str): Its media type.
+
+    Returns:
+        Response: The response, varying on the Accept header when binary
+        encodings are available.
+    """
+    response = Response(body, mimetype=mimetype)
+    if BINARY_SERIALIZERS:
+        response.vary.add('Accept')
+    return response
@@ -0,0 +1,254 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from api import DATABASE_URL, POOL_SIZE, POOL_MAX_OVERFLOW, POOL_TIMEOUT, book_cache
+from api.pragmas import configure_sqlite
+from api.v1.models import Books, BookChangeSequence
+from api.v1.routes import SEARCH_QUERY, parse_book_page, book_page_query, book_page_response
+from api.v1.routes import parse_batch_ids, batch_response, parse_search, search_response
+from api.v1.routes import cache_book, book_response
+from api.utils import format_response
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import os
+import threading
+"""
+This module contains async versions of the read routes of the API.
+
+The views answer the same URLs, with the same parameters and responses, as
+their counterparts in api.v1.routes: they share their request parsing,
+queries and response assembly, and only run the queries through
+SQLAlchemy's asyncio extension over the aiosqlite driver. They replace the
+blocking views when LIBRARY_ASYNC_VIEWS is on; writes, the export and the
+event stream keep their blocking views.
+
+Flask would run each async view in an event loop of its own, created for
+the request, and a connection opened in one loop cannot be used from
+another, so the async engine could not pool connections. run_in_event_loop
+replaces Flask's async_to_sync instead: every async view of a process runs
+on one long-lived event loop, in a thread started on first use, and the
+async engine keeps a pool of connections on that loop like the blocking
+engine does. The thread serving the request still waits for its view to
+finish, so on SQLite the async views serve somewhat fewer requests per
+second than the blocking ones (benchmarks/bench_async.py) and are off by
+default.
+
+The async views are:
+
+- GET /books: Retrieve books in the database, one page at a time.
+- GET /books/batch?ids=<ids>, POST /books/batch: Retrieve many books by ID at once.
+- GET /books/search: Search the title, description and summary of the books.
+- GET /books/<id>: Retrieve a specific book by ID.
+
+"""
+
+
+def async_database_url(url):
+    """
+    Select the aiosqlite driver for a SQLite database URL.
+
+    Args:
+        url (str): The SQLAlchemy database URL of the blocking engine.
+
+    Returns:
+        str: The URL with the async driver.
+    """
+    if url.startswith('sqlite:'):
+        return 'sqlite+aiosqlite:' + url[len('sqlite:'):]
+    return url
+
+
+async_engine = create_async_engine(
+    async_database_url(DATABASE_URL),
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT
+)
+configure_sqlite(async_engine.sync_engine)
+async_session = async_sessionmaker(async_engine, expire_on_commit=False)
+_loop = None
+_loop_thread = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+
+def event_loop():
+    """
+    Return the event loop the async views run on, starting it in a daemon
+    thread on first use in this process (and again in a forked worker).
+
+    Returns:
+        AbstractEventLoop: The running event loop.
+    """
+    global _loop, _loop_thread, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name='async-views', daemon=True)
+            _loop_thread.start()
+        return _loop
+
+
+def run_in_event_loop(func):
+    """
+    Make a coroutine function callable from a request thread.
+
+    Used as Flask's async_to_sync: the coroutine runs as a task on
+    event_loop(), in a copy of the caller's context so the request and
+    application contexts are available, and the caller waits for its result.
+
+    Args:
+        func (callable): The coroutine function.
+
+    Returns:
+        callable: A function that runs the coroutine and returns its result.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        loop = event_loop()
+        context = contextvars.copy_context()
+        future = concurrent.futures.Future()
+
+        def done(task):
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+        def start():
+            loop.create_task(func(*args, **kwargs), context=context).add_done_callback(done)
+
+        loop.call_soon_threadsafe(start)
+        return future.result()
+
+    return wrapper
+
+
+def dispose_async_engine():
+    """
+    Close the connections pooled by the async engine in this process and
+    stop its event loop; the next async view starts a new one.
+    """
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            return
+        loop, thread = _loop, _loop_thread
+        _loop = _loop_thread = None
+    asyncio.run_coroutine_threadsafe(async_engine.dispose(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+async def get_all_books():
+    """
+    Retrieve the books in the database, one page at a time.
+
+    See api.v1.routes.get_all_books for the query parameters.
+
+    Returns:
+        tuple: A JSON response of a page of books and the HTTP status code.
+    """
+    try:
+        page = parse_book_page()
+    except ValueError as e:
+        return format_response(
+            status='error',
+            message='Bad request',
+            code=400,
+            error={'details': e.args[0]}
+            )
+    async with async_session() as session:
+        result = await session.execute(book_page_query(page))
+    return book_page_response(page, result)
+
+
+async def get_books_batch():
+    """
+    Retrieve many books by id with a single query.
+
+    See api.v1.routes.get_books_batch for the parameters.
+
+    Returns:
+        tuple: A JSON response of the books and the HTTP status code.
+    """
+    try:
+        ids = parse_batch_ids()
+    except ValueError as e:
+        return format_response(
+            status='error',
+            message='Bad request',
+            code=400,
+            error={'details': e.args[0]}
+            )
+    async with async_session() as session:
+        result = await session.execute(select(Books).where(Books.id.in_(ids)))
+    return batch_response(ids, result)
+
+
+async def search_books():
+    """
+    Search the title, description and summary of the books.
+
+    See api.v1.routes.search_books for the query parameters.
+
+    Returns:
+        tuple: A JSON response of the matching books and the HTTP status code.
+    """
+    try:
+        search = parse_search()
+    except ValueError as e:
+        return format_response(
+            status='error',
+            message='Bad request',
+            code=400,
+            error={'details': e.args[0]}
+            )
+    async with async_session() as session:
+        result = await session.execute(SEARCH_QUERY, search)
+    return search_response(search, result)
+
+
+async def get_book(book_id):
+    """
+    Retrieve information about a certain book using its id.
+
+    Books are read through the same book cache as api.v1.routes.get_book,
+    and carry the same validators.
+
+    Args:
+        book_id (int or str): The id of the book to retrieve.
+
+    Returns:
+        tuple: A JSON response of the book and the HTTP status code.
+    """
+    try:
+        book_id = int(book_id)
+    except ValueError:
+        return format_response(
+            status='error',
+            message='Bad request',
+            code=400,
+            error={'details': 'Invalid book id'}
+            )
+    async with async_session() as session:
+        generation = book_cache.sync(await session.scalar(select(BookChangeSequence.seq)))
+        book = book_cache.get(book_id)
+        if book is None:
+            book = cache_book(book_id, await session.get(Books, book_id), generation)
+    return book_response(book_id, book)
+
+
+async_views = {
+    'get_all_books': get_all_books,
+    'get_books_batch': get_books_batch,
+    'search_books': search_books,
+    'get_book': get_book
+}
@@ -1,12 +1,55 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, Integer
-from datetime import datetime
+from sqlalchemy import String, Integer, SmallInteger, Date, DateTime, Index
+from sqlalchemy.types import TypeDecorator
+from datetime import date, datetime
 """
 This module defines the database metadata using SQLAlchemy.
 The Base class serves as the declarative base for metadata classes.
 """
 
 
+AVAILABILITY_STATUSES = (
+    'available',
+    'borrowed',
+    'reserved',
+    'returned',
+    'lost',
+    'unavailable'
+)
+BOOK_FACETS = ('genre', 'author', 'availability_status')
+
+
+class AvailabilityStatus(TypeDecorator):
+    """
+    Store an availability status as the small integer of its position in
+    AVAILABILITY_STATUSES, while the application reads and writes the name.
+
+    New statuses must be appended to AVAILABILITY_STATUSES so the codes of
+    the existing ones do not change.
+    """
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        """
+        Convert a status name to its code.
+        """
+        if value is None:
+            return None
+        try:
+            return AVAILABILITY_STATUSES.index(value)
+        except ValueError:
+            raise ValueError(f'Unknown availability status: {value!r}')
+
+    def process_result_value(self, value, dialect):
+        """
+        Convert a stored code back to its status name.
+        """
+        if value is None:
+            return None
+        return AVAILABILITY_STATUSES[value]
+
+
 class Library(DeclarativeBase):
     """
     This class acts as the declarative base for SQLAlchemy metadata classes.
@@ -17,19 +60,33 @@ class Library(DeclarativeBase):
 class Books(Library):
     """
     A class representing the Books table in the database.
+
+    change_seq is the position of the book's last change in the change feed.
+    It is assigned by a database trigger when the book is inserted or
+    updated, inside the writing transaction, so it follows commit order.
     """
     __tablename__ = "books"
+    __table_args__ = (
+        Index('ix_books_title', 'title'),
+        Index('ix_books_author', 'author'),
+        Index('ix_books_availability_status', 'availability_status'),
+        Index('ix_books_genre_availability_status', 'genre', 'availability_status'),
+        Index('ix_books_updated_at_id', 'updated_at', 'id'),
+        Index('ix_books_publication_date', 'publication_date'),
+        Index('ix_books_change_seq', 'change_seq'),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     title: Mapped[str] = mapped_column(String(50), nullable=False)
     author: Mapped[str] = mapped_column(String(50), nullable=False)
     genre: Mapped[str] = mapped_column(String(30), nullable=False)
     description: Mapped[str] = mapped_column(String(200), nullable=False)
-    publication_date: Mapped[str] = mapped_column(String, nullable=False)
-    availability_status: Mapped[str] = mapped_column(String(15), nullable=False)
+    publication_date: Mapped[date] = mapped_column(Date, nullable=False)
+    availability_status: Mapped[str] = mapped_column(AvailabilityStatus, nullable=False)
     edition: Mapped[str] = mapped_column(String(30), nullable=False)
     summary: Mapped[str] = mapped_column(String, nullable=False)
-    created_at: Mapped[str] = mapped_column(String(30), nullable=False, default=lambda: datetime.utcnow().isoformat() + 'Z')
-    updated_at: Mapped[str] = mapped_column(String(30), nullable=False, default=lambda: datetime.utcnow().isoformat() + 'Z', onupdate=lambda: datetime.utcnow().isoformat() + 'Z')
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
 
     def __repr__(self) -> str:
         """
@@ -40,3 +97,60 @@ class Books(Library):
                 f"publication_date={self.publication_date!r}, availability_status={self.availability_status!r}, "
                 f"edition={self.edition!r}, summary={self.summary!r}, "
                 f"created_at={self.created_at!r}, updated_at={self.updated_at!r})")
+
+
+class BookTombstones(Library):
+    """
+    A class representing the book_tombstones table in the database.
+
+    A row is written by a database trigger whenever a book is deleted, so the
+    change feed can report deletions, with a change_seq taken from the same
+    sequence as the books'.
+    """
+    __tablename__ = "book_tombstones"
+    __table_args__ = (
+        Index('ix_book_tombstones_change_seq', 'change_seq'),
+    )
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    book_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    deleted_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    change_seq: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        """
+        Return a string representation of the BookTombstones instance.
+        """
+        return (f"BookTombstones(id={self.id!r}, book_id={self.book_id!r}, deleted_at={self.deleted_at!r}, "
+                f"change_seq={self.change_seq!r})")
+
+
+class BookChangeSequence(Library):
+    """
+    A class representing the book_change_sequence table in the database.
+
+    Its single row holds the last change_seq given to a book or tombstone.
+    The triggers increment it inside the writing transaction, and SQLite
+    runs one writing transaction at a time, so sequence numbers are handed
+    out in commit order.
+    """
+    __tablename__ = "book_change_sequence"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    seq: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class BookFacetCounts(Library):
+    """
+    A class representing the book_facet_counts table in the database.
+
+    Each row holds the number of books with one value of a facet ('genre',
+    'author' or 'availability_status', the latter stored as its code).
+    Database triggers keep the counts in step with every write to the books
+    table.
+    """
+    __tablename__ = "book_facet_counts"
+    facet: Mapped[str] = mapped_column(String(30), primary_key=True)
+    value: Mapped[str] = mapped_column(String(50), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+Index('ix_book_facet_counts_facet_count', BookFacetCounts.facet, BookFacetCounts.count.desc(), BookFacetCounts.value)
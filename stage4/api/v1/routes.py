@@ -1,8 +1,18 @@
-from flask import request, Blueprint
-from api.v1.models import Books
-from api import session
-from datetime import datetime
-from api.utils import format_response, validate_book_data
+from flask import request, Blueprint, Response, stream_with_context
+from sqlalchemy import select, text, insert, update, delete, func
+from api.v1.models import Books, BookTombstones, BookFacetCounts, BookChangeSequence, AVAILABILITY_STATUSES
+from api import session, book_cache, book_events
+from sqlalchemy.sql import column
+from sqlalchemy.types import String, Float
+from api.serializers import dumps
+import queue
+from api.utils import format_response, validate_book_data, parse_page_size, encode_cursor, decode_cursor
+from api.utils import parse_book_filters, parse_offset, build_match_query, parse_fields, format_books_list
+from api.utils import parse_book_ids, decode_change_cursor, parse_publication_range, parse_facets
+from api.utils import parse_book_data, parse_batch_size, read_ndjson
+from api.utils import parse_book_updates, parse_book_selection
+from api.utils import compute_etag, parse_timestamp, is_not_modified, not_modified_response, add_validators
+from api.utils import format_book, format_timestamp, stream_books, EXPORT_BATCH_SIZE, EXPORT_FORMATS
 """
 This module contains all the routes for the API.
 
@@ -10,10 +20,21 @@ The routes are all prefixed with '/api/v1/books'.
 
 The routes are as follows:
 
-- GET /books: Retrieve all books in the database.
+- GET /books: Retrieve books in the database, one page at a time.
+- GET /books/batch?ids=<ids>, POST /books/batch: Retrieve many books by ID at once.
+- GET /books/changes: Retrieve the books changed and deleted since a cursor.
+- GET /books/facets: Count the books per genre, author and availability status.
+- GET /books/export: Stream every book in the database as NDJSON or JSON.
+- GET /books/search: Search the title, description and summary of the books.
+- GET /books/events: Stream the book created, updated and deleted events.
 - GET /books/<id>: Retrieve a specific book by ID.
+- GET /cache/stats: Retrieve the counters of the book cache.
 - POST /books: Create a new book.
+- POST /books/bulk: Create many books in one transaction.
+- PATCH /books/bulk: Update the selected books with a single statement.
+- DELETE /books/bulk: Delete the selected books with a single statement.
 - PUT /books/<id>: Update a specific book by ID.
+- PATCH /books/<id>: Update some of the fields of a specific book by ID.
 - DELETE /books/<id>: Delete a specific book by ID.
 
 """
@@ -21,47 +42,530 @@ The routes are as follows:
 
 library_v1 = Blueprint('books_v1', __name__)
 version = '/api/v1'
+EVENT_HEARTBEAT = 15
+EVENT_RETRY = b'retry: 3000\n\n'
+EVENT_KEEP_ALIVE = b': keep-alive\n\n'
+
+
+def parse_book_page():
+    """
+    Parse the query parameters of a page of books.
+
+    Returns:
+        dict: The page size ('limit'), the cursor ('after'), the columns
+            ('fields'), the exact-match 'filters' and the publication range
+            ('published_from' and 'published_to').
+
+    Raises:
+        ValueError: If a query parameter is invalid.
+    """
+    published_from, published_to = parse_publication_range(request.args)
+    return {
+        'limit': parse_page_size(request.args.get('limit')),
+        'after': decode_cursor(request.args.get('after')),
+        'fields': parse_fields(request.args.get('fields')),
+        'filters': parse_book_filters(request.args),
+        'published_from': published_from,
+        'published_to': published_to
+    }
+
+
+def book_page_query(page):
+    """
+    Build the query of a page of books, with one row more than the page
+    size to tell whether another page follows.
+
+    Args:
+        page (dict): The parameters returned by parse_book_page.
+
+    Returns:
+        Select: The query.
+    """
+    if page['fields'] is None:
+        query = select(Books)
+    else:
+        columns = dict.fromkeys(page['fields'] + ('updated_at',))
+        query = select(*[getattr(Books, column) for column in columns])
+    query = query.filter_by(**page['filters']).order_by(Books.id)
+    if page['published_from'] is not None:
+        query = query.where(Books.publication_date >= page['published_from'])
+    if page['published_to'] is not None:
+        query = query.where(Books.publication_date <= page['published_to'])
+    if page['after'] is not None:
+        query = query.where(Books.id > page['after'])
+    return query.limit(page['limit'] + 1)
+
+
+def book_page_response(page, result):
+    """
+    Answer with a page of books, or with 304 Not Modified when the client
+    already has it.
+
+    Args:
+        page (dict): The parameters returned by parse_book_page.
+        result (Result): The rows of book_page_query.
+
+    Returns:
+        tuple: A JSON response of a page of books and the HTTP status code.
+    """
+    fields = page['fields']
+    books = result.scalars().all() if fields is None else result.all()
+    next_cursor = None
+    if len(books) > page['limit']:
+        books = books[:page['limit']]
+        next_cursor = encode_cursor(books[-1].id)
+    etag = compute_etag(books, next_cursor, fields)
+    if is_not_modified(etag):
+        return not_modified_response(etag)
+    if fields is not None:
+        books = format_books_list(books, fields)
+    return add_validators(format_response(
+        data=books,
+        status='success',
+        message='Books retrieved successfully',
+        code=200,
+        extra={'next_cursor': next_cursor}
+        ), etag)
 
 
 @library_v1.route(f'{version}/books', methods=['GET'], strict_slashes=False)
 def get_all_books():
     """
-    Retrieve all books in the database.
+    Retrieve the books in the database, one page at a time.
+
+    Books are paginated by id. The 'limit' query parameter sets the page size
+    (capped at MAX_PAGE_SIZE) and the 'after' query parameter takes the
+    'next_cursor' returned with the previous page. The 'title', 'author',
+    'genre' and 'availability_status' query parameters restrict the books to
+    exact matches, each backed by an index on the books table, and
+    'published_from' and 'published_to' (YYYY-MM-DD, inclusive) restrict the
+    publication date with an index range scan.
+
+    The 'fields' query parameter takes a comma-separated list of columns;
+    only those columns (and the id) are selected from the database and returned.
+
+    The response carries an ETag computed from the id and updated_at of the
+    books on the page; a request whose If-None-Match matches it gets a 304
+    without the page being serialized.
 
     Returns:
-        tuple: A JSON response of all books and the HTTP status code.
+        tuple: A JSON response of a page of books and the HTTP status code.
     """
-    if request.method == 'GET':
-        books = session.query(Books).all()
+    try:
+        page = parse_book_page()
+    except ValueError as e:
         return format_response(
-            data=books,
-            status='success',
-            message='Books retrieved successfully',
-            code=200
+            status='error',
+            message='Bad request',
+            code=400,
+            error={'details': e.args[0]}
             )
+    return book_page_response(page, session.execute(book_page_query(page)))
 
 
-@library_v1.route(f'{version}/books/<book_id>', methods=['GET'], strict_slashes=False)
-def get_book(book_id):
+def parse_batch_ids():
     """
-    Retrieve information about a certain book using its id.
+    Read the ids of a batch request, from the 'ids' query parameter (GET)
+    or the 'ids' list of the JSON body (POST).
+
+    Returns:
+        list: The ids of the books.
+
+    Raises:
+        ValueError: If the ids are missing or invalid.
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        value = data.get('ids') if isinstance(data, dict) else None
+    else:
+        value = request.args.get('ids')
+    return parse_book_ids(value)
+
+
+def batch_response(ids, result):
+    """
+    Answer with the books of a batch request in the order they were requested.
 
     Args:
-        book_id (int or str): The id of the book to retrieve.
+        ids (list): The ids of the books.
+        result (Result): The rows of the books found.
 
     Returns:
-        tuple: A JSON response of all books and the HTTP status code.
+        tuple: A JSON response of the books and the HTTP status code.
+    """
+    found = {book.id: book for book in result.scalars()}
+    return format_response(
+        data=[found[book_id] for book_id in ids if book_id in found],
+        status='success',
+        message='Books retrieved successfully',
+        code=200,
+        extra={'missing_ids': [book_id for book_id in ids if book_id not in found]}
+        )
+
+
+@library_v1.route(f'{version}/books/batch', methods=['GET', 'POST'], strict_slashes=False)
+def get_books_batch():
+    """
+    Retrieve many books by id with a single query.
+
+    The ids are given as a comma-separated 'ids' query parameter (GET) or as
+    an 'ids' list in the JSON body (POST). The books are returned in the
+    order the ids were requested, and the ids that matched no book are
+    listed in 'missing_ids'.
+
+    Returns:
+        tuple: A JSON response of the books and the HTTP status code.
     """
     try:
-        book_id = int(book_id)
-    except ValueError:
+        ids = parse_batch_ids()
+    except ValueError as e:
         return format_response(
             status='error',
             message='Bad request',
             code=400,
-            error={'details': 'Invalid book id'}
+            error={'details': e.args[0]}
             )
-    book = session.query(Books).filter_by(id=book_id).first()
+    return batch_response(ids, session.execute(select(Books).where(Books.id.in_(ids))))
+
+
+@library_v1.route(f'{version}/books/changes', methods=['GET'], strict_slashes=False)
+def get_changes():
+    """
+    Retrieve the books created, updated or deleted since a cursor.
+
+    Every insert, update and delete of a book takes the next number of the
+    change sequence inside its transaction, so changes are returned in the
+    order they were committed, and a poller never skips a change that was
+    committed after a later-stamped one. Books and the tombstones of deleted
+    books are both read with index range scans on change_seq, so a sync
+    costs O(changes) rather than O(catalog). Without a 'since' cursor the
+    feed starts from the beginning. The response holds the changed books,
+    the 'deleted' books and the 'next_cursor' to poll with next; 'has_more'
+    tells whether more changes are waiting.
+
+    Returns:
+        tuple: A JSON response of the changes and the HTTP status code.
+    """
+    try:
+        limit = parse_page_size(request.args.get('limit'))
+        since = decode_change_cursor(request.args.get('since'))
+    except ValueError as e:
+        return format_response(
+            status='error',
+            message='Bad request',
+            code=400,
+            error={'details': e.args[0]}
+            )
+    books = session.query(Books)
+    tombstones = session.query(BookTombstones)
+    if since is not None:
+        books = books.filter(Books.change_seq > since)
+        tombstones = tombstones.filter(BookTombstones.change_seq > since)
+    changes = [(book.change_seq, book.id, book) for book in
+               books.order_by(Books.change_seq).limit(limit + 1)]
+    changes += [(tombstone.change_seq, tombstone.book_id, tombstone) for tombstone in
+                tombstones.order_by(BookTombstones.change_seq).limit(limit + 1)]
+    changes.sort(key=lambda change: change[0])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    next_cursor = request.args.get('since')
+    if changes:
+        change_seq, book_id, _ = changes[-1]
+        next_cursor = encode_cursor(book_id, change_seq)
+    return format_response(
+        data=[change for _, _, change in changes if isinstance(change, Books)],
+        status='success',
+        message='Changes retrieved successfully',
+        code=200,
+        extra={
+            'deleted': [{'id': change.book_id, 'deleted_at': format_timestamp(change.deleted_at)}
+                        for _, _, change in changes if isinstance(change, BookTombstones)],
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }
+        )
+
+
+@library_v1.route(f'{version}/books/facets', methods=['GET'], strict_slashes=False)
+def get_facets():
+    """
+    Count the books per value of each facet: genre, author and availability status.
+
+    The 'facets' query parameter selects the facets (all by default) and
+    'limit' the number of values returned per facet, the most frequent first.
+    Without filters the counts are read from book_facet_counts, which
+    triggers keep up to date on every write, so no book is scanned. The
+    'title', 'author', 'genre', 'availability_status', 'published_from' and
+    'published_to' query parameters count only the matching books instead,
+    with one GROUP BY query per facet.
+
+    Returns:
+        tuple: A JSON response of the facet counts and the HTTP status code.
+    """
+    try:
+        facets = parse_facets(request.args.get('facets'))
+        limit = parse_page_size(request.args.get('limit'))
+        filters = parse_book_filters(request.args)
+        published_from, published_to = parse_publication_range(request.args)
+    except ValueError as e:
+        return format_response(
+            status='error',
+            message='Bad request',
+            code=400,
+            error={'details': e.args[0]}
+            )
+    counts = {}
+    if not filters and published_from is None and published_to is None:
+        for facet in facets:
+            rows = session.query(BookFacetCounts.value, BookFacetCounts.count) \
+                .filter(BookFacetCounts.facet == facet, BookFacetCounts.count > 0) \
+                .order_by(BookFacetCounts.count.desc(), BookFacetCounts.value).limit(limit)
+            if facet == 'availability_status':
+                rows = [(AVAILABILITY_STATUSES[int(value)], count) for value, count in rows]
+            counts[facet] = [{'value': value, 'count': count} for value, count in rows]
+        total = session.query(func.coalesce(func.sum(BookFacetCounts.count), 0)) \
+            .filter(BookFacetCounts.facet == 'availability_status').scalar()
+    else:
+        books = session.query(Books).filter_by(**filters)
+        if published_from is not None:
+            books = books.filter(Books.publication_date >= published_from)
+        if published_to is not None:
+            books = books.filter(Books.publication_date <= published_to)
+        for facet in facets:
+            value = getattr(Books, facet)
+            rows = books.with_entities(value, func.count()).group_by(value) \
+                .order_by(func.count().desc(), value).limit(limit)
+            counts[facet] = [{'value': value, 'count': count} for value, count in rows]
+        total = books.count()
+    return format_response(
+        status='success',
+        message='Facets retrieved successfully',
+        code=200,
+        extra={'facets': counts, 'total': total}
+        )
+
+
+@library_v1.route(f'{version}/books/export', methods=['GET'], strict_slashes=False)
+def export_books():
+    """
+    Stream every book in the database.
+
+    Rows are fetched from the database in batches of EXPORT_BATCH_SIZE and
+    written to a chunked response as they arrive, so memory use does not grow
+    with the size of the catalog. The 'format' query parameter selects
+    'ndjson' (the default) or 'json', and the 'fields' query parameter
+    restricts the columns that are selected and exported.
+
+    The response carries an ETag computed from the last number of the change
+    sequence, which every insert, update and delete of a book advances in
+    its own transaction, so it is read from a single row. A client holding
+    the current export gets a 304, and the compressed export is served from
+    the compressed cache until the catalog changes, without reading a book.
+
+    Returns:
+        Response: A streamed response of all books.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    try:
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f'Unsupported export format: {export_format}')
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return format_response(
+            status='error',
+            message='Bad request',
+            code=400,
+            error={'details': e.args[0]}
+            )
+    change_seq = session.query(BookChangeSequence.seq).scalar()
+    etag = compute_etag([], export_format, fields, change_seq)
+    if is_not_modified(etag):
+        return not_modified_response(etag)
+    columns = Books.__table__.columns if fields is None else [Books.__table__.c[column] for column in fields]
+
+    def rows():
+        yield from session.execute(
+            select(*columns)
+            .order_by(Books.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+    response = Response(
+        stream_with_context(stream_books(rows(), export_format, fields)),
+        mimetype=EXPORT_FORMATS[export_format]
+        )
+    return add_validators((response, 200), etag)
+
+
+SEARCH_QUERY = text("""
+    SELECT books.*,
+           snippet(books_fts, -1, '[', ']', '...', 12) AS snippet,
+           bm25(books_fts) AS rank
+    FROM books_fts JOIN books ON books.id = books_fts.rowid
+    WHERE books_fts MATCH :match
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+""").columns(*Books.__table__.columns, column('snippet', String), column('rank', Float))
+
+
+def parse_search():
+    """
+    Parse the query parameters of a search.
+
+    Returns:
+        dict: The parameters of SEARCH_QUERY: the FTS5 'match' expression,
+            and the 'limit' (one more than the page size) and 'offset'.
+
+    Raises:
+        ValueError: If the search query is empty or a parameter is invalid.
+    """
+    match = build_match_query(request.args.get('q', ''))
+    if not match:
+        raise ValueError('The search query (q) must not be empty')
+    limit = parse_page_size(request.args.get('limit'))
+    return {'match': match, 'limit': limit + 1, 'offset': parse_offset(request.args.get('offset'))}
+
+
+def search_response(search, result):
+    """
+    Answer with a page of search results.
+
+    Args:
+        search (dict): The parameters returned by parse_search.
+        result (Result): The rows of SEARCH_QUERY.
+
+    Returns:
+        tuple: A JSON response of the matching books and the HTTP status code.
+    """
+    limit = search['limit'] - 1
+    rows = result.all()
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_offset = search['offset'] + limit
+    books = []
+    for row in rows:
+        book = format_book(row)
+        book['snippet'] = row.snippet
+        book['rank'] = row.rank
+        books.append(book)
+    return format_response(
+        data=books,
+        status='success',
+        message='Books retrieved successfully',
+        code=200,
+        extra={'next_offset': next_offset}
+        )
+
+
+@library_v1.route(f'{version}/books/search', methods=['GET'], strict_slashes=False)
+def search_books():
+    """
+    Search the title, description and summary of the books.
+
+    The 'q' query parameter holds the words to search for; every word must
+    appear in the book. Results are ranked by BM25 relevance, each with a
+    snippet of the matching text, and paginated with 'limit' and 'offset'.
+
+    Returns:
+        tuple: A JSON response of the matching books and the HTTP status code.
+    """
+    try:
+        search = parse_search()
+    except ValueError as e:
+        return format_response(
+            status='error',
+            message='Bad request',
+            code=400,
+            error={'details': e.args[0]}
+            )
+    return search_response(search, session.execute(SEARCH_QUERY, search))
+
+
+def format_event(event):
+    """
+    Encode a book event as a Server-Sent Event.
+
+    Args:
+        event (dict): An event published on the event bus.
+
+    Returns:
+        bytes: The event's id, name and JSON data, ended by a blank line.
+    """
+    return (f"id: {event['id']}\nevent: {event['type']}\n".encode()
+            + b'data: ' + dumps(event['data']) + b'\n\n')
+
+
+@library_v1.route(f'{version}/books/events', methods=['GET'], strict_slashes=False)
+def stream_events():
+    """
+    Stream the book events as Server-Sent Events.
+
+    Every book created, updated or deleted through the API is pushed as an
+    event named 'book.created', 'book.updated' or 'book.deleted', with the
+    ids of the books (or the filter of a bulk request) and their count. A
+    comment is sent every EVENT_HEARTBEAT seconds to keep idle connections
+    open. A client that falls more than the queue size behind loses its
+    oldest events.
+
+    Returns:
+        Response: A streamed 'text/event-stream' response.
+    """
+    def generate():
+        # Subscribed only once the body is read, so a response that is closed
+        # before its first chunk leaves no subscriber behind
+        subscriber = book_events.subscribe()
+        try:
+            yield EVENT_RETRY
+            while True:
+                try:
+                    event = subscriber.get(timeout=EVENT_HEARTBEAT)
+                except queue.Empty:
+                    yield EVENT_KEEP_ALIVE
+                    continue
+                yield format_event(event)
+        finally:
+            book_events.unsubscribe(subscriber)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def cache_book(book_id, row, generation):
+    """
+    Format a book read from the database and keep it in the book cache.
+
+    Args:
+        book_id (int): The id of the book.
+        row (Books or None): The book, or None if it does not exist.
+        generation (int or None): The cache generation returned by
+            book_cache.sync() before the query, so a book invalidated in the
+            meantime is not cached, or None to not cache the book.
+
+    Returns:
+        dict or None: The formatted book, or None if it does not exist.
+    """
+    if row is None:
+        return None
+    book = format_book(row)
+    if generation is not None:
+        book_cache.set(book_id, book, generation)
+    return book
+
+
+def book_response(book_id, book):
+    """
+    Answer with a book and its validators, with 304 Not Modified when the
+    client already has it, or with 404 when it does not exist.
+
+    Args:
+        book_id (int): The id of the book.
+        book (dict or None): The formatted book, or None if it does not exist.
+
+    Returns:
+        tuple: A JSON response of the book and the HTTP status code.
+    """
     if book is None:
         return format_response(
             status='error',
@@ -69,12 +573,52 @@ def get_book(book_id):
             code=404,
             error={'details': f'No book was found for the given id({book_id})'}
             )
-    return format_response(
+    etag = compute_etag([book])
+    last_modified = parse_timestamp(book['updated_at'])
+    if is_not_modified(etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    return add_validators(format_response(
         data=[book],
         status='success',
         message='Books retrieved successfully',
         code=200
-        )
+        ), etag, last_modified)
+
+
+@library_v1.route(f'{version}/books/<book_id>', methods=['GET'], strict_slashes=False)
+def get_book(book_id):
+    """
+    Retrieve information about a certain book using its id.
+
+    The response carries an ETag and a Last-Modified time taken from the
+    book's updated_at, and If-None-Match or If-Modified-Since requests for an
+    unchanged book are answered with 304 Not Modified.
+
+    Formatted books are kept in the in-process book cache; every route that
+    changes a book invalidates its entry once the change is committed. The
+    cache is cleared before a lookup when the change sequence has moved on,
+    so changes committed by another worker process are never hidden by it.
+
+    Args:
+        book_id (int or str): The id of the book to retrieve.
+
+    Returns:
+        tuple: A JSON response of all books and the HTTP status code.
+    """
+    try:
+        book_id = int(book_id)
+    except ValueError:
+        return format_response(
+            status='error',
+            message='Bad request',
+            code=400,
+            error={'details': 'Invalid book id'}
+            )
+    generation = book_cache.sync(session.query(BookChangeSequence.seq).scalar())
+    book = book_cache.get(book_id)
+    if book is None:
+        book = cache_book(book_id, session.get(Books, book_id), generation)
+    return book_response(book_id, book)
 
 
 @library_v1.route(f'{version}/books', methods=['POST'], strict_slashes=False)
@@ -89,18 +633,11 @@ def add_book():
         data = request.get_json()
         missing_keys = validate_book_data(data)
         if not missing_keys:
-            book = Books(
-                title=data['title'],
-                author=data['author'],
-                genre=data['genre'],
-                description=data['description'],
-                publication_date=datetime.strptime(data['publication_date'], '%Y-%m-%d').date().isoformat(),
-                availability_status=data['availability_status'],
-                edition=data['edition'],
-                summary=data['summary']
-            )
+            book = Books(**parse_book_data(data))
             session.add(book)
             session.commit()
+            book_cache.invalidate(book.id)
+            book_events.publish('book.created', {'ids': [book.id], 'count': 1})
             return format_response(
                 data=[book],
                 status='success',
@@ -117,10 +654,211 @@ def add_book():
     except ValueError as e:
         return format_response(
             status='error',
-            message='Invalid date format',
+            message='Invalid field value',
+            code=400,
+            error={'details': e.args[0]}
+            )
+
+
+@library_v1.route(f'{version}/books/bulk', methods=['POST'], strict_slashes=False)
+def add_books():
+    """
+    Add many books to the library in a single transaction.
+
+    The body is either a JSON array of books or, with the
+    'application/x-ndjson' content type, one book per line. Every book is
+    validated like in add_book; the valid ones are inserted with multi-row
+    statements of 'batch_size' rows (a query parameter) and committed once,
+    and the invalid ones are reported by their position in the body.
+
+    Returns:
+        tuple: A JSON response with the number of books created, the errors
+        and the HTTP status code.
+    """
+    try:
+        batch_size = parse_batch_size(request.args.get('batch_size'))
+    except ValueError as e:
+        return format_response(
+            status='error',
+            message='Bad request',
+            code=400,
+            error={'details': e.args[0]}
+            )
+    if request.mimetype == 'application/x-ndjson':
+        items = read_ndjson(request.stream)
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            return format_response(
+                status='error',
+                message='Bad request',
+                code=400,
+                error={'details': 'Expected a JSON array of books'}
+                )
+    created = 0
+    errors = []
+    batch = []
+    for index, data in enumerate(items):
+        if isinstance(data, ValueError):
+            errors.append({'index': index, 'details': f'Invalid JSON: {data.args[0]}'})
+            continue
+        if not isinstance(data, dict):
+            errors.append({'index': index, 'details': 'Each book must be a JSON object'})
+            continue
+        missing_keys = validate_book_data(data)
+        if missing_keys:
+            errors.append({'index': index, 'details': f'Missing required fields: {missing_keys}'})
+            continue
+        try:
+            batch.append(parse_book_data(data))
+        except ValueError as e:
+            errors.append({'index': index, 'details': e.args[0]})
+            continue
+        if len(batch) == batch_size:
+            session.execute(insert(Books), batch)
+            created += len(batch)
+            batch = []
+    if batch:
+        session.execute(insert(Books), batch)
+        created += len(batch)
+    session.commit()
+    if created:
+        book_events.publish('book.created', {'count': created})
+    if not created:
+        return format_response(
+            status='error',
+            message='No books were added',
+            code=400,
+            error={'details': errors or 'No books were given'}
+            )
+    return format_response(
+        status='success',
+        message=f'{created} books added successfully',
+        code=201,
+        extra={'created': created, 'errors': errors}
+        )
+
+
+def selection_criteria(ids, filters):
+    """
+    Build the WHERE criteria for the books selected by a bulk request.
+
+    Args:
+        ids (list or None): The ids of the books.
+        filters (dict or None): Exact matches on the filter columns.
+
+    Returns:
+        list: The criteria for an update() or delete() statement.
+    """
+    if ids is not None:
+        return [Books.id.in_(ids)]
+    return [getattr(Books, key) == value for key, value in filters.items()]
+
+
+def invalidate_selection(ids):
+    """
+    Drop the books changed by a bulk request from the book cache.
+
+    Args:
+        ids (list or None): The ids of the books, or None when they were
+            selected by filter, in which case the whole cache is cleared.
+    """
+    if ids is not None:
+        book_cache.invalidate(*ids)
+    else:
+        book_cache.clear()
+
+
+def publish_selection(event_type, ids, filters, count):
+    """
+    Publish the event of a bulk request that changed books.
+
+    Args:
+        event_type (str): The name of the event.
+        ids (list or None): The ids of the selected books.
+        filters (dict or None): The filters that selected the books.
+        count (int): The number of books changed.
+    """
+    if not count:
+        return
+    if ids is not None:
+        book_events.publish(event_type, {'ids': ids, 'count': count})
+    else:
+        book_events.publish(event_type, {'filter': filters, 'count': count})
+
+
+@library_v1.route(f'{version}/books/bulk', methods=['PATCH'], strict_slashes=False)
+def update_books():
+    """
+    Update the books selected by id or filter with one UPDATE statement.
+
+    The body holds the selection ('ids' or 'filter') and the new column
+    values ('values'). No book is loaded into memory.
+
+    Returns:
+        tuple: A JSON response with the number of books updated and the HTTP status code.
+    """
+    data = request.get_json(silent=True)
+    try:
+        ids, filters = parse_book_selection(data)
+        values = parse_book_updates(data.get('values'))
+    except ValueError as e:
+        return format_response(
+            status='error',
+            message='Bad request',
+            code=400,
+            error={'details': e.args[0]}
+            )
+    result = session.execute(
+        update(Books)
+        .where(*selection_criteria(ids, filters))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+        )
+    session.commit()
+    invalidate_selection(ids)
+    publish_selection('book.updated', ids, filters, result.rowcount)
+    return format_response(
+        status='success',
+        message='Books updated successfully',
+        code=200,
+        extra={'updated': result.rowcount}
+        )
+
+
+@library_v1.route(f'{version}/books/bulk', methods=['DELETE'], strict_slashes=False)
+def delete_books():
+    """
+    Delete the books selected by id or filter with one DELETE statement.
+
+    The body holds the selection ('ids' or 'filter'). No book is loaded into memory.
+
+    Returns:
+        tuple: A JSON response with the number of books deleted and the HTTP status code.
+    """
+    try:
+        ids, filters = parse_book_selection(request.get_json(silent=True))
+    except ValueError as e:
+        return format_response(
+            status='error',
+            message='Bad request',
             code=400,
             error={'details': e.args[0]}
             )
+    result = session.execute(
+        delete(Books)
+        .where(*selection_criteria(ids, filters))
+        .execution_options(synchronize_session=False)
+        )
+    session.commit()
+    invalidate_selection(ids)
+    publish_selection('book.deleted', ids, filters, result.rowcount)
+    return format_response(
+        status='success',
+        message='Books deleted successfully',
+        code=200,
+        extra={'deleted': result.rowcount}
+        )
 
 
 @library_v1.route(f'{version}/books/<book_id>', methods=['PUT'], strict_slashes=False)
@@ -152,15 +890,11 @@ def update_book(book_id):
         data = request.get_json()
         missing_keys = validate_book_data(data)
         if not missing_keys:
-            book.title=data['title']
-            book.author=data['author']
-            book.genre=data['genre']
-            book.description=data['description']
-            book.publication_date=datetime.strptime(data['publication_date'], '%Y-%m-%d').date().isoformat()
-            book.availability_status=data['availability_status']
-            book.edition=data['edition']
-            book.summary=data['summary']
+            for key, value in parse_book_data(data).items():
+                setattr(book, key, value)
             session.commit()
+            book_cache.invalidate(book_id)
+            book_events.publish('book.updated', {'ids': [book_id], 'count': 1})
             return format_response(
                 data=[book],
                 status='success',
@@ -178,12 +912,84 @@ def update_book(book_id):
     except ValueError as e:
         return format_response(
             status='error',
-            message='Invalid date format',
+            message='Invalid field value',
             code=400,
             error={'details': e.args[0]}
         )
 
 
+@library_v1.route(f'{version}/books/<book_id>', methods=['PATCH'], strict_slashes=False)
+def patch_book(book_id):
+    """
+    Update some of the fields of a specific book.
+
+    Only the fields present in the body are written, with a single
+    UPDATE ... RETURNING statement that also refreshes updated_at; the book
+    is not read beforehand. If the body carries the 'updated_at' of the
+    version the client last saw, the update only applies if the book has not
+    changed since, and a 409 Conflict is returned otherwise.
+
+    Returns:
+        tuple: A JSON response of the updated book and the HTTP status code.
+    """
+    try:
+        book_id = int(book_id)
+    except ValueError:
+        return format_response(
+            status='error',
+            message='Bad request',
+            code=400,
+            error={'details': 'Invalid book id'}
+            )
+    data = request.get_json(silent=True)
+    try:
+        if not isinstance(data, dict):
+            raise ValueError('Expected an object with the fields to update')
+        expected = data.pop('updated_at', None)
+        if expected is not None:
+            expected = parse_timestamp(expected).replace(tzinfo=None)
+        values = parse_book_updates(data)
+    except ValueError as e:
+        return format_response(
+            status='error',
+            message='Bad request',
+            code=400,
+            error={'details': e.args[0]}
+            )
+    statement = update(Books).where(Books.id == book_id)
+    if expected is not None:
+        statement = statement.where(Books.updated_at == expected)
+    row = session.execute(
+        statement
+        .values(**values)
+        .returning(*Books.__table__.columns)
+        .execution_options(synchronize_session=False)
+        ).first()
+    session.commit()
+    if row is None:
+        if expected is not None and session.query(Books.id).filter_by(id=book_id).first() is not None:
+            return format_response(
+                status='error',
+                message='Conflict',
+                code=409,
+                error={'details': f'The book ({book_id}) was modified since {format_timestamp(expected)}'}
+                )
+        return format_response(
+            status='error',
+            message='Book not found',
+            code=404,
+            error={'details': f'No book was found for the given id({book_id})'}
+            )
+    book_cache.invalidate(book_id)
+    book_events.publish('book.updated', {'ids': [book_id], 'count': 1})
+    return format_response(
+        data=[format_book(row)],
+        status='success',
+        message='Book updated successfully',
+        code=200
+        )
+
+
 @library_v1.route(f'{version}/books/<book_id>', methods=['DELETE'], strict_slashes=False)
 def delete_book(book_id):
     """
@@ -211,8 +1017,26 @@ def delete_book(book_id):
         )
     session.delete(book)
     session.commit()
+    book_cache.invalidate(book_id)
+    book_events.publish('book.deleted', {'ids': [book_id], 'count': 1})
     return format_response(
         status='success',
         message='Book deleted successfully',
         code=204
-    )
\ No newline at end of file
+    )
+
+
+@library_v1.route(f'{version}/cache/stats', methods=['GET'], strict_slashes=False)
+def get_cache_stats():
+    """
+    Retrieve the size and the hit, miss and eviction counters of the book cache.
+
+    Returns:
+        tuple: A JSON response of the cache statistics and the HTTP status code.
+    """
+    return format_response(
+        status='success',
+        message='Cache statistics retrieved successfully',
+        code=200,
+        extra={'cache': book_cache.stats()}
+        )
@@ -0,0 +1,331 @@
+from sqlalchemy import text, MetaData
+from api.v1.models import Library, Books, AVAILABILITY_STATUSES, BOOK_FACETS
+from datetime import date, datetime
+import logging
+"""
+This module prepares the database schema.
+
+Library.metadata.create_all only creates indexes together with a new table, so
+indexes added to the models later are created here for databases that
+already have the table, and indexes removed from the models are dropped.
+
+On SQLite it also maintains 'books_fts', an FTS5 index over the title,
+description and summary of every book. The index stores no copy of the text
+(it reads it from the books table) and triggers keep it in step with every
+insert, update and delete, including bulk statements that bypass the ORM.
+
+Triggers also keep 'book_facet_counts' up to date, so the number of books
+per genre, author and availability status is read without scanning the
+books table.
+
+Another trigger records a tombstone in 'book_tombstones' for every deleted
+book, so the change feed can report deletions made by any route. Every
+insert, update and delete also takes the next number of the change
+sequence ('book_change_sequence') and stores it in the change_seq of the
+book or tombstone, inside the writing transaction, so the change feed pages
+through changes in commit order rather than by timestamp.
+
+Databases created before the books table had typed columns (dates and
+timestamps stored as free-form strings, availability status as text) are
+migrated in place: the rows are copied into a table with the current schema,
+converting every value, and the new table replaces the old one.
+"""
+
+
+logger = logging.getLogger(__name__)
+MIGRATION_BATCH_SIZE = 1000
+# Indexes made redundant by a later index that serves the same queries
+DROPPED_INDEXES = ('ix_books_genre', 'ix_book_tombstones_deleted_at_book_id')
+CHANGE_COLUMNS = tuple(column.name for column in Books.__table__.columns if column.name not in ('id', 'change_seq'))
+
+
+BOOKS_FTS_DDL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title, description, summary, content='books', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, description, summary)
+        VALUES (new.id, new.title, new.description, new.summary);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, description, summary)
+        VALUES ('delete', old.id, old.title, old.description, old.summary);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, description, summary ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, description, summary)
+        VALUES ('delete', old.id, old.title, old.description, old.summary);
+        INSERT INTO books_fts(rowid, title, description, summary)
+        VALUES (new.id, new.title, new.description, new.summary);
+    END
+    """
+)
+
+
+BOOK_CHANGES_DDL = (
+    """
+    CREATE TRIGGER IF NOT EXISTS books_change_insert AFTER INSERT ON books BEGIN
+        UPDATE book_change_sequence SET seq = seq + 1;
+        UPDATE books SET change_seq = (SELECT seq FROM book_change_sequence) WHERE id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS books_change_update AFTER UPDATE OF {', '.join(CHANGE_COLUMNS)} ON books
+    BEGIN
+        UPDATE book_change_sequence SET seq = seq + 1;
+        UPDATE books SET change_seq = (SELECT seq FROM book_change_sequence) WHERE id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_tombstone AFTER DELETE ON books BEGIN
+        UPDATE book_change_sequence SET seq = seq + 1;
+        INSERT INTO book_tombstones(book_id, deleted_at, change_seq)
+        VALUES (old.id, strftime('%Y-%m-%d %H:%M:%f', 'now') || '000', (SELECT seq FROM book_change_sequence));
+    END
+    """
+)
+
+
+BOOK_FACET_COUNTS_DDL = (
+    """
+    CREATE TRIGGER IF NOT EXISTS books_facets_insert AFTER INSERT ON books BEGIN
+        INSERT INTO book_facet_counts(facet, value, count)
+        VALUES ('genre', new.genre, 1), ('author', new.author, 1),
+               ('availability_status', CAST(new.availability_status AS TEXT), 1)
+        ON CONFLICT(facet, value) DO UPDATE SET count = count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_facets_delete AFTER DELETE ON books BEGIN
+        UPDATE book_facet_counts SET count = count - 1
+        WHERE (facet = 'genre' AND value = old.genre)
+           OR (facet = 'author' AND value = old.author)
+           OR (facet = 'availability_status' AND value = CAST(old.availability_status AS TEXT));
+        DELETE FROM book_facet_counts
+        WHERE count = 0 AND ((facet = 'genre' AND value = old.genre)
+           OR (facet = 'author' AND value = old.author)
+           OR (facet = 'availability_status' AND value = CAST(old.availability_status AS TEXT)));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_facets_update AFTER UPDATE OF genre, author, availability_status ON books
+    BEGIN
+        UPDATE book_facet_counts SET count = count - 1
+        WHERE (facet = 'genre' AND value = old.genre)
+           OR (facet = 'author' AND value = old.author)
+           OR (facet = 'availability_status' AND value = CAST(old.availability_status AS TEXT));
+        DELETE FROM book_facet_counts
+        WHERE count = 0 AND ((facet = 'genre' AND value = old.genre)
+           OR (facet = 'author' AND value = old.author)
+           OR (facet = 'availability_status' AND value = CAST(old.availability_status AS TEXT)));
+        INSERT INTO book_facet_counts(facet, value, count)
+        VALUES ('genre', new.genre, 1), ('author', new.author, 1),
+               ('availability_status', CAST(new.availability_status AS TEXT), 1)
+        ON CONFLICT(facet, value) DO UPDATE SET count = count + 1;
+    END
+    """
+)
+
+
+def init_schema(engine):
+    """
+    Create the tables, any columns and indexes they are missing, the
+    full-text index, the facet counters and the change sequence triggers, and
+    drop the indexes no longer used.
+
+    Args:
+        engine (Engine): The engine of the database to prepare.
+    """
+    Library.metadata.create_all(engine)
+    if engine.dialect.name == 'sqlite':
+        with engine.begin() as connection:
+            migrate_typed_columns(connection)
+    with engine.begin() as connection:
+        if engine.dialect.name == 'sqlite':
+            add_change_columns(connection)
+        for index in DROPPED_INDEXES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {index}"))
+        for table in Library.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        if engine.dialect.name == 'sqlite':
+            init_full_text_search(connection)
+            init_facet_counts(connection)
+            init_change_sequence(connection)
+
+
+def add_change_columns(connection):
+    """
+    Add the change_seq column to the books and tombstones of a database
+    created before the change sequence existed.
+
+    Args:
+        connection (Connection): A SQLite connection inside a transaction.
+    """
+    for table in ('books', 'book_tombstones'):
+        columns = [row[1] for row in connection.execute(text(f"PRAGMA table_info({table})"))]
+        if 'change_seq' not in columns:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0"))
+
+
+def init_change_sequence(connection):
+    """
+    Create the triggers that number every change to the books, numbering
+    the books and tombstones that have no change_seq yet first.
+
+    Rows written before the sequence existed, or copied by a migration, are
+    numbered in the order of their updated_at or deleted_at, after the
+    changes already numbered. A tombstone trigger from before the sequence
+    is replaced.
+
+    Args:
+        connection (Connection): A SQLite connection inside a transaction.
+    """
+    connection.execute(text("INSERT OR IGNORE INTO book_change_sequence(id, seq) VALUES (1, 0)"))
+    trigger = connection.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'books_tombstone'"
+    )).scalar()
+    if trigger is not None and 'change_seq' not in trigger:
+        connection.execute(text("DROP TRIGGER books_tombstone"))
+    connection.execute(text("""
+        CREATE TEMP TABLE pending_changes AS
+        SELECT kind, row_id, row_number() OVER (ORDER BY changed_at, book_id, kind) AS n FROM (
+            SELECT 'book' AS kind, id AS row_id, updated_at AS changed_at, id AS book_id
+            FROM books WHERE change_seq = 0
+            UNION ALL
+            SELECT 'tombstone', id, deleted_at, book_id FROM book_tombstones WHERE change_seq = 0
+        )
+    """))
+    pending = connection.execute(text("SELECT count(*) FROM pending_changes")).scalar()
+    if pending:
+        logger.warning('Numbering %d changes made before the change sequence', pending)
+        last = connection.execute(text("SELECT seq FROM book_change_sequence")).scalar()
+        connection.execute(text(
+            "UPDATE books SET change_seq = :last + pending_changes.n FROM pending_changes "
+            "WHERE pending_changes.kind = 'book' AND pending_changes.row_id = books.id"
+        ), {'last': last})
+        connection.execute(text(
+            "UPDATE book_tombstones SET change_seq = :last + pending_changes.n FROM pending_changes "
+            "WHERE pending_changes.kind = 'tombstone' AND pending_changes.row_id = book_tombstones.id"
+        ), {'last': last})
+        connection.execute(text("UPDATE book_change_sequence SET seq = :seq"), {'seq': last + pending})
+    connection.execute(text("DROP TABLE pending_changes"))
+    for statement in BOOK_CHANGES_DDL:
+        connection.execute(text(statement))
+
+
+def init_full_text_search(connection):
+    """
+    Create the FTS5 index and its triggers, filling the index from the
+    existing books when it is first created.
+
+    Args:
+        connection (Connection): A connection inside a transaction.
+    """
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+    )).first()
+    for statement in BOOKS_FTS_DDL:
+        connection.execute(text(statement))
+    if exists is None:
+        connection.execute(text("INSERT INTO books_fts(books_fts) VALUES ('rebuild')"))
+
+
+def init_facet_counts(connection):
+    """
+    Create the triggers that maintain book_facet_counts, counting the
+    existing books with one GROUP BY per facet when the triggers are missing.
+
+    The triggers disappear with the books table when it is rebuilt, so the
+    counts are also recomputed after a migration.
+
+    Args:
+        connection (Connection): A connection inside a transaction.
+    """
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'books_facets_insert'"
+    )).first()
+    if exists is None:
+        connection.execute(text("DELETE FROM book_facet_counts"))
+        for facet in BOOK_FACETS:
+            connection.execute(text(
+                f"INSERT INTO book_facet_counts(facet, value, count) "
+                f"SELECT '{facet}', CAST({facet} AS TEXT), count(*) FROM books GROUP BY {facet}"
+            ))
+    for statement in BOOK_FACET_COUNTS_DDL:
+        connection.execute(text(statement))
+
+
+def migrate_typed_columns(connection):
+    """
+    Convert a books table with string dates, timestamps and status to the
+    typed columns of the Books model.
+
+    The rows are copied in batches into a new table created from the model,
+    which then replaces the old table; its indexes and triggers are created
+    again by init_schema. Tombstone timestamps are rewritten in the storage
+    format of the DateTime type. Nothing is done if the table is already typed.
+
+    Args:
+        connection (Connection): A SQLite connection inside a transaction.
+    """
+    columns = {row[1]: row[2] for row in connection.execute(text("PRAGMA table_info(books)"))}
+    if columns.get('availability_status', 'SMALLINT').upper() == 'SMALLINT':
+        return
+    logger.warning('Migrating the books table to typed columns')
+    connection.execute(text("DROP TABLE IF EXISTS books_typed"))
+    typed = Books.__table__.to_metadata(MetaData(), name='books_typed')
+    typed.indexes.clear()
+    typed.create(connection)
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            text("SELECT * FROM books WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {'last_id': last_id, 'limit': MIGRATION_BATCH_SIZE}
+        ).mappings().all()
+        if not rows:
+            break
+        connection.execute(typed.insert(), [convert_legacy_book(row) for row in rows])
+        last_id = rows[-1]['id']
+    connection.execute(text("DROP TABLE books"))
+    connection.execute(text("ALTER TABLE books_typed RENAME TO books"))
+    connection.execute(text(
+        "UPDATE book_tombstones SET deleted_at = replace(replace(deleted_at, 'T', ' '), 'Z', '') "
+        "WHERE deleted_at LIKE '%Z'"
+    ))
+    if connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+    )).first() is not None:
+        connection.execute(text("INSERT INTO books_fts(books_fts) VALUES ('rebuild')"))
+
+
+def convert_legacy_book(row):
+    """
+    Convert a row of the string-typed books table to typed values.
+
+    Statuses that are not in AVAILABILITY_STATUSES are stored as 'unavailable'.
+
+    Args:
+        row (dict): The row, as stored in the old table.
+
+    Returns:
+        dict: The row with a date, timestamps and a known status.
+    """
+    status = row['availability_status'].strip().lower()
+    if status not in AVAILABILITY_STATUSES:
+        logger.warning('Book %s has unknown availability status %r, stored as unavailable',
+                       row['id'], row['availability_status'])
+        status = 'unavailable'
+    return dict(
+        row,
+        publication_date=date.fromisoformat(row['publication_date'][:10]),
+        availability_status=status,
+        created_at=datetime.fromisoformat(row['created_at'].rstrip('Z')),
+        updated_at=datetime.fromisoformat(row['updated_at'].rstrip('Z'))
+    )
@@ -0,0 +1,113 @@
+"""
+The ASGI entry point of the application.
+
+The Flask application is wrapped for an ASGI server with a2wsgi. The server
+accepts connections, reads requests and writes responses on its event loop,
+and runs each request on a pool of LIBRARY_ASGI_THREADS threads (default
+10). A thread stays busy until the whole response has been handed to the
+server, so the routes whose responses last are kept off that pool:
+
+- /api/v1/books/events is served on the event loop itself. The event bus
+  wakes the stream up when a book event is published, so an open stream
+  holds no thread at all, however many clients are connected.
+- /api/v1/books/export runs on its own pool of LIBRARY_ASGI_EXPORT_THREADS
+  threads (default 4), so slow or concurrent exports only wait for each
+  other and never for the other requests.
+
+The blocking views are served unless LIBRARY_ASYNC_VIEWS is on (see
+api.v1.async_routes). Flask still waits for an async view on the request
+thread, so the async views do not let a thread serve more requests at once.
+Install the dependencies with pip install -r requirements-async.txt and serve
+it with uvicorn from the stage4 directory:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 4
+
+asgiref's WsgiToAsgi is not used: it runs every request on one shared
+thread and fails when a keep-alive connection sends its next request.
+"""
+from a2wsgi import WSGIMiddleware
+from api import app, book_events
+from api.v1.routes import version, format_event, EVENT_HEARTBEAT, EVENT_RETRY, EVENT_KEEP_ALIVE
+import asyncio
+import os
+import queue
+
+
+ASGI_THREADS = int(os.environ.get('LIBRARY_ASGI_THREADS', 10))
+ASGI_EXPORT_THREADS = int(os.environ.get('LIBRARY_ASGI_EXPORT_THREADS', 4))
+EVENTS_PATH = f'{version}/books/events'
+EXPORT_PATH = f'{version}/books/export'
+EVENT_STREAM_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no')
+]
+
+wsgi_application = WSGIMiddleware(app, workers=ASGI_THREADS)
+export_application = WSGIMiddleware(app, workers=ASGI_EXPORT_THREADS)
+
+
+async def stream_events(scope, receive, send):
+    """
+    Stream the book events as Server-Sent Events on the event loop, as the
+    /books/events view does on a thread.
+
+    The stream waits for the event bus to wake it up, sends a comment every
+    EVENT_HEARTBEAT seconds to keep an idle connection open, and ends when
+    the client disconnects.
+    """
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+
+    def notify():
+        # Called on the thread that published the event
+        try:
+            loop.call_soon_threadsafe(ready.set)
+        except RuntimeError:
+            pass
+
+    async def stream():
+        await send({'type': 'http.response.start', 'status': 200, 'headers': EVENT_STREAM_HEADERS})
+        await send({'type': 'http.response.body', 'body': EVENT_RETRY, 'more_body': True})
+        while True:
+            try:
+                body = format_event(subscriber.get_nowait())
+            except queue.Empty:
+                ready.clear()
+                if not subscriber.empty():
+                    continue
+                try:
+                    await asyncio.wait_for(ready.wait(), EVENT_HEARTBEAT)
+                    continue
+                except asyncio.TimeoutError:
+                    body = EVENT_KEEP_ALIVE
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    subscriber = book_events.subscribe(notify)
+    tasks = [asyncio.ensure_future(stream()), asyncio.ensure_future(disconnected())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        book_events.unsubscribe(subscriber)
+        for task in tasks:
+            task.cancel()
+        # A send to a client that is gone fails; there is no one left to tell
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def application(scope, receive, send):
+    """
+    Serve a connection: the event stream on the event loop, exports on the
+    export pool and every other request on the request pool.
+    """
+    if scope['type'] == 'http':
+        path = scope['path'].rstrip('/')
+        if path == EVENTS_PATH and scope['method'] == 'GET':
+            return await stream_events(scope, receive, send)
+        if path == EXPORT_PATH:
+            return await export_application(scope, receive, send)
+    await wsgi_application(scope, receive, send)
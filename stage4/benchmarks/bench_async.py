@@ -0,0 +1,150 @@
+"""
+Benchmark the library API served by the development server, by the pre-fork
+launcher and by uvicorn.
+
+The benchmark seeds a temporary database, then starts the API in turn with
+the threaded Werkzeug development server, with serve.py and one worker per
+core, with uvicorn and the blocking views, and with uvicorn and the async
+views (asgi.py). Each server receives
+GET requests from an increasing number of concurrent clients, each on its own
+keep-alive connection, and the requests served per second and the median and
+99th percentile latencies are reported at each level of concurrency.
+
+Run it from the stage4 directory after pip install -r requirements-async.txt:
+    python3 benchmarks/bench_async.py [--books N] [--seconds N] [--clients 1,8,32,64]
+"""
+from datetime import date
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SERVERS = {
+    'werkzeug': ([sys.executable, '-c',
+                  'import sys; from api import app; app.run(port=int(sys.argv[1]), threaded=True)'],
+                 {'LIBRARY_ASYNC_VIEWS': 'off'}),
+    'prefork': ([sys.executable, 'serve.py', '--host', '127.0.0.1', '--port'], {'LIBRARY_ASYNC_VIEWS': 'off'}),
+    'uvicorn sync': ([sys.executable, '-m', 'uvicorn', 'asgi:application', '--log-level', 'warning', '--port'],
+                     {'LIBRARY_ASYNC_VIEWS': 'off'}),
+    'uvicorn async': ([sys.executable, '-m', 'uvicorn', 'asgi:application', '--log-level', 'warning', '--port'],
+                      {'LIBRARY_ASYNC_VIEWS': 'on'}),
+}
+
+
+def seed(database_url, count):
+    """
+    Create the benchmark database with `count` books.
+    """
+    os.environ['LIBRARY_DATABASE_URL'] = database_url
+    from api import session
+    from api.v1.models import Books
+    session.add_all([
+        Books(title=f"Book {i}", author=f"Author {i % 100}", genre="Fiction",
+              description="A benchmark book", publication_date=date(2024, 10, 31),
+              availability_status="available", edition="1st Edition",
+              summary="A benchmark summary")
+        for i in range(count)
+    ])
+    session.commit()
+    session.remove()
+
+
+def free_port():
+    """
+    Return a TCP port nobody listens on.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(name, database_url, port):
+    """
+    Start one of the SERVERS on the port and wait until it accepts connections.
+    """
+    command, env = SERVERS[name]
+    process = subprocess.Popen(command + [str(port)], env=dict(os.environ, LIBRARY_DATABASE_URL=database_url, **env),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{name} did not start')
+
+
+def run(port, clients, seconds, book_count):
+    """
+    Send requests from `clients` concurrent connections for `seconds` seconds.
+
+    Returns:
+        tuple: The requests per second and the sorted latencies in seconds.
+    """
+    latencies = []
+    errors = []
+    deadline = time.monotonic() + seconds
+
+    def client(offset):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        i = 0
+        while time.monotonic() < deadline:
+            path = f'/api/v1/books/{(offset + i) % book_count + 1}' if i % 2 else '/api/v1/books?limit=20'
+            start = time.perf_counter()
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - start)
+            if response.status != 200:
+                errors.append(response.status)
+            i += 1
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(n * 7,)) for n in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise RuntimeError(f'{len(errors)} requests failed: {set(errors)}')
+    return len(latencies) / elapsed, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--clients', default='1,8,32,64')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        seed(database_url, args.books)
+        for name in SERVERS:
+            port = free_port()
+            process = start_server(name, database_url, port)
+            try:
+                for clients in (int(n) for n in args.clients.split(',')):
+                    rate, latencies = run(port, clients, args.seconds, args.books)
+                    p50 = latencies[len(latencies) // 2] * 1000
+                    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+                    print(f'{name:>14} {clients:>3} clients: {rate:8.1f} requests/s, '
+                          f'p50 {p50:7.2f} ms, p99 {p99:7.2f} ms')
+            finally:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == '__main__':
+    main()
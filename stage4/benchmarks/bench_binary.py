@@ -0,0 +1,102 @@
+"""
+Benchmark the binary response encodings against JSON.
+
+Encodes the same listing with Flask's jsonify (the original path), with
+format_response as JSON, and with format_response as MessagePack and CBOR
+when msgpack and cbor2 are installed, then reports the encode time, the
+time a client needs to decode the payload and the payload size of each.
+
+Run it from the stage4 directory:
+    python3 benchmarks/bench_binary.py [--books N] [--rounds N]
+"""
+from datetime import date, datetime
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+def make_books(Books, count):
+    """
+    Build `count` transient books with every column filled in.
+    """
+    return [
+        Books(id=i, title=f"Book {i}", author=f"Author {i % 100}", genre="Fiction",
+              description="A benchmark book " * 5, publication_date=date(2024, 10, 31),
+              availability_status="available", edition="1st Edition",
+              summary="A benchmark summary " * 20,
+              created_at=datetime(2024, 10, 31, 23, 59, 59), updated_at=datetime(2024, 10, 31, 23, 59, 59))
+        for i in range(1, count + 1)
+    ]
+
+
+def timed(function, rounds):
+    """
+    Return the mean seconds per call of `function` over `rounds` calls.
+    """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['LIBRARY_DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        from flask import jsonify
+        from api import app
+        from api.v1.models import Books
+        from api.utils import format_books_list, format_response
+
+        books = make_books(Books, args.books)
+        formats = [('application/json', json.loads)]
+        if msgpack is not None:
+            formats.append(('application/msgpack', msgpack.unpackb))
+        if cbor2 is not None:
+            formats.append(('application/cbor', cbor2.loads))
+
+        results = []
+        with app.app_context():
+            def baseline():
+                return jsonify({'status': 'success', 'message': '', 'http_code': 200,
+                                'data': {'books': format_books_list(books)}}).get_data()
+
+            payload = baseline()
+            results.append(('jsonify', timed(baseline, args.rounds),
+                            timed(lambda: json.loads(payload), args.rounds), len(payload)))
+            for mimetype, loads in formats:
+                with app.test_request_context(headers={'Accept': mimetype}):
+                    def encode():
+                        return format_response(data=books)[0].get_data()
+
+                    payload = encode()
+                    results.append((mimetype.split('/')[1], timed(encode, args.rounds),
+                                    timed(lambda: loads(payload), args.rounds), len(payload)))
+
+    print(f'{"format":>10} {"encode ms":>10} {"decode ms":>10} {"bytes":>10}')
+    for label, encode_seconds, decode_seconds, size in results:
+        print(f'{label:>10} {encode_seconds * 1000:10.2f} {decode_seconds * 1000:10.2f} {size:10d}')
+    if msgpack is None or cbor2 is None:
+        print('Install msgpack and cbor2 to compare the binary encodings.')
+
+
+if __name__ == '__main__':
+    main()
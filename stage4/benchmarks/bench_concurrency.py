@@ -0,0 +1,88 @@
+"""
+Benchmark the throughput of the library API under concurrent requests.
+
+The benchmark seeds a temporary database, then issues the same number of
+GET requests from an increasing number of threads and reports the requests
+served per second at each level of concurrency.
+
+Run it from the stage4 directory:
+    python3 benchmarks/bench_concurrency.py [--books N] [--requests N] [--threads 1,2,4,8]
+"""
+from datetime import date
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def seed(session, Books, count):
+    """
+    Insert `count` books into the benchmark database.
+    """
+    session.add_all([
+        Books(title=f"Book {i}", author=f"Author {i % 100}", genre="Fiction",
+              description="A benchmark book", publication_date=date(2024, 10, 31),
+              availability_status="available", edition="1st Edition",
+              summary="A benchmark summary")
+        for i in range(count)
+    ])
+    session.commit()
+    session.remove()
+
+
+def run(app, total_requests, threads, book_count):
+    """
+    Issue `total_requests` GET requests split across `threads` threads.
+
+    Returns:
+        float: The number of requests served per second.
+    """
+    per_thread = total_requests // threads
+    errors = []
+
+    def worker(offset):
+        client = app.test_client()
+        for i in range(per_thread):
+            book_id = (offset + i) % book_count + 1
+            if i % 2:
+                response = client.get(f'/api/v1/books/{book_id}')
+            else:
+                response = client.get('/api/v1/books?limit=20')
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    workers = [threading.Thread(target=worker, args=(n * per_thread,)) for n in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise RuntimeError(f'{len(errors)} requests failed: {set(errors)}')
+    return per_thread * threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', default='1,2,4,8')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['LIBRARY_DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        from api import app, session
+        from api.v1.models import Books
+        seed(session, Books, args.books)
+        for threads in (int(n) for n in args.threads.split(',')):
+            rate = run(app, args.requests, threads, args.books)
+            print(f'{threads:>3} threads: {rate:10.1f} requests/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark the serialization of book listings.
+
+Compares the original path (format_books_list followed by Flask's jsonify)
+with format_response, which joins per-book JSON fragments encoded by the
+selected serializer, both with a cold and with a warm fragment cache.
+
+Run it from the stage4 directory:
+    python3 benchmarks/bench_serialization.py [--books N] [--rounds N]
+"""
+from datetime import date, datetime
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_books(Books, count):
+    """
+    Build `count` transient books with every column filled in.
+    """
+    return [
+        Books(id=i, title=f"Book {i}", author=f"Author {i % 100}", genre="Fiction",
+              description="A benchmark book " * 5, publication_date=date(2024, 10, 31),
+              availability_status="available", edition="1st Edition",
+              summary="A benchmark summary " * 20,
+              created_at=datetime(2024, 10, 31, 23, 59, 59), updated_at=datetime(2024, 10, 31, 23, 59, 59))
+        for i in range(1, count + 1)
+    ]
+
+
+def timed(function, rounds):
+    """
+    Return the mean seconds per call of `function` over `rounds` calls.
+    """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['LIBRARY_DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        from flask import jsonify
+        from api import app
+        from api.v1.models import Books
+        from api.serializers import SERIALIZER, fragment_cache
+        from api.utils import format_books_list, format_response
+
+        books = make_books(Books, args.books)
+        with app.app_context():
+            def baseline():
+                jsonify({'status': 'success', 'message': '', 'http_code': 200,
+                         'data': {'books': format_books_list(books)}}).get_data()
+
+            def cold():
+                fragment_cache.clear()
+                format_response(data=books)[0].get_data()
+
+            def warm():
+                format_response(data=books)[0].get_data()
+
+            results = [('jsonify', timed(baseline, args.rounds)),
+                       (f'{SERIALIZER} cold', timed(cold, args.rounds))]
+            warm()
+            results.append((f'{SERIALIZER} warm', timed(warm, args.rounds)))
+
+    reference = results[0][1]
+    for label, seconds in results:
+        print(f'{label:>14}: {seconds * 1000:8.2f} ms per {args.books} books ({reference / seconds:5.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark mixed read/write throughput with and without the SQLite tuning.
+
+Several reader threads page through the books table while writer threads
+insert and update books, each in its own committed transaction. The run is
+repeated against a fresh database with SQLite's defaults and with the pragmas
+from api.pragmas, and the operations per second of each are reported.
+
+Run it from the stage4 directory:
+    python3 benchmarks/bench_sqlite.py [--seconds N] [--readers N] [--writers N]
+"""
+from datetime import date
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from api.pragmas import configure_sqlite, DEFAULT_PRAGMAS
+from api.v1.models import Library, Books
+
+
+def make_book(i):
+    """
+    Build a benchmark book.
+    """
+    return Books(title=f"Book {i}", author=f"Author {i % 100}", genre="Fiction",
+                 description="A benchmark book", publication_date=date(2024, 10, 31),
+                 availability_status="available", edition="1st Edition",
+                 summary="A benchmark summary")
+
+
+def run(pragmas, seconds, readers, writers, seed_count):
+    """
+    Run the mixed workload against a fresh database.
+
+    Returns:
+        tuple: Reads per second, writes per second and the number of writes
+        that failed because the database was locked.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}",
+                               pool_size=readers + writers,
+                               connect_args={'check_same_thread': False})
+        configure_sqlite(engine, pragmas)
+        Library.metadata.create_all(engine)
+        with Session(engine) as session:
+            session.add_all([make_book(i) for i in range(seed_count)])
+            session.commit()
+
+        counts = {'reads': 0, 'writes': 0, 'locked': 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def reader():
+            done = 0
+            with Session(engine) as session:
+                while time.perf_counter() < deadline:
+                    after = (done * 50) % seed_count
+                    session.execute(select(Books).where(Books.id > after).order_by(Books.id).limit(50)).all()
+                    session.rollback()
+                    done += 1
+            with lock:
+                counts['reads'] += done
+
+        def writer(offset):
+            done = locked = 0
+            with Session(engine) as session:
+                while time.perf_counter() < deadline:
+                    try:
+                        if done % 2:
+                            session.add(make_book(offset + done))
+                        else:
+                            session.execute(update(Books)
+                                            .where(Books.id == (offset + done) % seed_count + 1)
+                                            .values(availability_status='borrowed'))
+                        session.commit()
+                        done += 1
+                    except OperationalError:
+                        session.rollback()
+                        locked += 1
+            with lock:
+                counts['writes'] += done
+                counts['locked'] += locked
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads += [threading.Thread(target=writer, args=(n * 1000000,)) for n in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+        return counts['reads'] / seconds, counts['writes'] / seconds, counts['locked']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--books', type=int, default=5000)
+    args = parser.parse_args()
+
+    for label, pragmas in (('defaults', {}), ('tuned', DEFAULT_PRAGMAS)):
+        reads, writes, locked = run(pragmas, args.seconds, args.readers, args.writers, args.books)
+        print(f'{label:>8}: {reads:10.1f} reads/s {writes:10.1f} writes/s {locked:6d} locked')
+
+
+if __name__ == '__main__':
+    main()
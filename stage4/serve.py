@@ -0,0 +1,387 @@
+"""
+A pre-fork launcher that serves the API from several worker processes.
+
+Importing the api package creates the database schema, so the parent process
+sets the schema up once, closes the connections it used for that, opens the
+listening socket and forks the workers. Each worker drops the connection pool
+and the session registry it inherited from the parent, so it never touches a
+SQLite file handle opened in another process, and serves requests on the
+shared socket with a threaded Werkzeug server; the kernel spreads the
+incoming connections across the workers.
+
+SIGTERM or SIGINT stops the parent, which forwards the signal to the
+workers. A worker stops accepting connections, waits up to
+LIBRARY_SHUTDOWN_TIMEOUT seconds for its requests in progress and exits; the
+parent kills the workers still running after that. A worker that dies on its
+own is replaced; when workers keep dying within LIBRARY_RESTART_WINDOW seconds
+of their start, each replacement waits twice as long as the last, up to
+LIBRARY_RESTART_DELAY_MAX seconds, so a worker that cannot start does not
+make the parent fork in a tight loop.
+
+The book cache, the compressed response cache and the event bus belong to
+each worker. The book cache is cleared whenever the database's change
+sequence has moved on, so a book changed through one worker is never served
+stale by another. Each worker is connected to the parent by a socket pair:
+it sends every book event it publishes to the parent, which forwards it to
+the other workers, so Server-Sent Events report the changes made through
+any worker. A worker that stops reading its relay for
+LIBRARY_RELAY_TIMEOUT seconds is cut off from it.
+
+Run it from the stage4 directory:
+    python3 serve.py [--host HOST] [--port PORT] [--workers N]
+"""
+from werkzeug.serving import make_server
+from werkzeug.wsgi import ClosingIterator
+from api import app, engine, session, book_events
+import argparse
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import threading
+import time
+
+
+HOST = os.environ.get('LIBRARY_HOST', '0.0.0.0')
+PORT = int(os.environ.get('LIBRARY_PORT', 5000))
+WORKERS = int(os.environ.get('LIBRARY_WORKERS', 0)) or os.cpu_count() or 1
+SHUTDOWN_TIMEOUT = float(os.environ.get('LIBRARY_SHUTDOWN_TIMEOUT', 30))
+BACKLOG = int(os.environ.get('LIBRARY_BACKLOG', 128))
+RESTART_WINDOW = float(os.environ.get('LIBRARY_RESTART_WINDOW', 10))
+RESTART_DELAY_MAX = float(os.environ.get('LIBRARY_RESTART_DELAY_MAX', 30))
+RELAY_TIMEOUT = float(os.environ.get('LIBRARY_RELAY_TIMEOUT', 5))
+RELAY_BUFFER_SIZE = 65536
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTracker:
+    """
+    A WSGI middleware that counts the requests in progress, so a worker can
+    wait for them before it exits.
+    """
+
+    def __init__(self, application):
+        """
+        Wrap a WSGI application.
+
+        Args:
+            application (callable): The WSGI application to serve.
+        """
+        self.application = application
+        self.active = 0
+        self._idle = threading.Condition()
+
+    def __call__(self, environ, start_response):
+        """
+        Serve a request, counting it as in progress until its response,
+        streamed or not, has been sent and closed.
+        """
+        with self._idle:
+            self.active += 1
+        try:
+            return ClosingIterator(self.application(environ, start_response), self._finished)
+        except BaseException:
+            self._finished()
+            raise
+
+    def _finished(self):
+        """
+        Count a request as done.
+        """
+        with self._idle:
+            self.active -= 1
+            if not self.active:
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout):
+        """
+        Wait until no request is in progress.
+
+        Args:
+            timeout (float): The most seconds to wait.
+
+        Returns:
+            bool: True if the requests finished, False if the time ran out.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: not self.active, timeout)
+
+
+class EventRelay:
+    """
+    Carries the book events of a worker to and from the parent, as lines of
+    JSON on the worker's end of their socket pair.
+    """
+
+    def __init__(self, connection, bus):
+        """
+        Relay the events of a bus.
+
+        Args:
+            connection (socket): The worker's end of the socket pair.
+            bus (EventBus): The event bus of the worker.
+        """
+        self.connection = connection
+        self.bus = bus
+        self._lock = threading.Lock()
+
+    def __call__(self, event_type, data):
+        """
+        Send an event published in this worker to the parent.
+        """
+        message = json.dumps({'type': event_type, 'data': data}, separators=(',', ':')).encode() + b'\n'
+        with self._lock:
+            try:
+                self.connection.sendall(message)
+            except OSError:
+                logger.warning('Worker %d could not relay a %s event', os.getpid(), event_type)
+
+    def start(self):
+        """
+        Relay the events published on the bus, and deliver the events the
+        parent forwards from the other workers on a background thread.
+        """
+        self.bus.relay = self
+        threading.Thread(target=self._receive, daemon=True).start()
+
+    def _receive(self):
+        """
+        Deliver the forwarded events until the parent closes the connection.
+        """
+        try:
+            with self.connection.makefile('rb') as lines:
+                for line in lines:
+                    event = json.loads(line)
+                    self.bus.deliver(event['type'], event['data'])
+        except OSError:
+            pass
+
+
+def relay_events(relays, timeout):
+    """
+    Wait for events sent by the workers and forward each one to the other
+    workers.
+
+    Args:
+        relays (BaseSelector): The parent's ends of the socket pairs, each
+            registered with a buffer of the bytes received after its last
+            complete line.
+        timeout (float): The most seconds to wait.
+    """
+    for key, _ in relays.select(timeout):
+        if key.fileobj.fileno() == -1:
+            continue
+        try:
+            data = key.fileobj.recv(RELAY_BUFFER_SIZE)
+        except OSError:
+            data = b''
+        if not data:
+            close_relay(relays, key.fileobj)
+            continue
+        key.data.extend(data)
+        end = key.data.rfind(b'\n') + 1
+        if not end:
+            continue
+        lines = bytes(key.data[:end])
+        del key.data[:end]
+        for other in list(relays.get_map().values()):
+            if other.fileobj is key.fileobj:
+                continue
+            try:
+                other.fileobj.sendall(lines)
+            except OSError:
+                # A partial line may have been sent, so the connection cannot be used again
+                logger.warning('Closing the event relay of a worker that stopped reading it')
+                close_relay(relays, other.fileobj)
+
+
+def close_relay(relays, connection):
+    """
+    Stop relaying events to and from a worker.
+
+    Args:
+        relays (BaseSelector): The parent's ends of the socket pairs.
+        connection (socket): The parent's end of the worker's socket pair.
+    """
+    relays.unregister(connection)
+    connection.close()
+
+
+def listen(host, port, backlog=BACKLOG):
+    """
+    Open the listening socket the workers share.
+
+    Args:
+        host (str): The address to listen on.
+        port (int): The TCP port to listen on, 0 for any free port.
+        backlog (int): The most connections waiting to be accepted.
+
+    Returns:
+        socket: The listening socket.
+    """
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def run_worker(sock, connection=None):
+    """
+    Serve requests on the shared socket until SIGTERM or SIGINT.
+
+    Called in a freshly forked worker: the connections pooled by the parent
+    are forgotten without being closed, since they belong to the parent, and
+    the worker opens its own as it needs them.
+
+    Args:
+        sock (socket): The listening socket opened by the parent.
+        connection (socket): The worker's end of its socket pair with the
+            parent, to relay the book events through, or None.
+    """
+    engine.dispose(close=False)
+    session.remove()
+    if connection is not None:
+        EventRelay(connection, book_events).start()
+    tracker = RequestTracker(app)
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, tracker, threaded=True, fd=sock.fileno())
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, so it cannot run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if not tracker.wait_idle(SHUTDOWN_TIMEOUT):
+            logger.warning('Worker %d exits with %d requests in progress', os.getpid(), tracker.active)
+        session.remove()
+        engine.dispose()
+
+
+def spawn_worker(sock, relays):
+    """
+    Fork a worker process connected to the parent by a socket pair.
+
+    Args:
+        sock (socket): The listening socket opened by the parent.
+        relays (BaseSelector): The parent's ends of the socket pairs of the
+            running workers, where the new worker's is registered.
+
+    Returns:
+        int: The process id of the worker.
+    """
+    parent_end, worker_end = socket.socketpair()
+    pid = os.fork()
+    if pid:
+        worker_end.close()
+        parent_end.settimeout(RELAY_TIMEOUT)
+        relays.register(parent_end, selectors.EVENT_READ, bytearray())
+        return pid
+    # The parent's handlers would make the worker signal its siblings
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    parent_end.close()
+    for key in list(relays.get_map().values()):
+        key.fileobj.close()
+    relays.close()
+    code = 0
+    try:
+        run_worker(sock, worker_end)
+    except BaseException:
+        logger.exception('Worker %d failed', os.getpid())
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def restart_delay(failures):
+    """
+    Compute how long to wait before replacing a worker.
+
+    Args:
+        failures (int): The number of workers in a row that died within
+            RESTART_WINDOW seconds of their start.
+
+    Returns:
+        float: The seconds to wait, doubling from 0.5 with each failure up
+        to RESTART_DELAY_MAX, or 0 if the last worker ran long enough.
+    """
+    if not failures:
+        return 0
+    return min(RESTART_DELAY_MAX, 0.5 * 2 ** (failures - 1))
+
+
+def serve(host=HOST, port=PORT, workers=WORKERS):
+    """
+    Serve the API from `workers` processes until SIGTERM or SIGINT.
+
+    Args:
+        host (str): The address to listen on.
+        port (int): The TCP port to listen on.
+        workers (int): The number of worker processes.
+    """
+    sock = listen(host, port)
+    # The schema was set up on import; the workers must not inherit its connections
+    engine.dispose()
+    relays = selectors.DefaultSelector()
+    children = {spawn_worker(sock, relays): time.monotonic() for _ in range(workers)}
+    logger.info('Serving on %s:%d with %d workers', host, sock.getsockname()[1], workers)
+    stopping = []
+    restarts = []
+    failures = 0
+
+    def stop(signum, frame):
+        if not stopping:
+            stopping.append(time.monotonic() + SHUTDOWN_TIMEOUT)
+            for pid in children:
+                os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while children or (restarts and not stopping):
+        now = time.monotonic()
+        if restarts and not stopping and restarts[0] <= now:
+            restarts.pop(0)
+            children[spawn_worker(sock, relays)] = now
+            continue
+        pid, status = os.waitpid(-1, os.WNOHANG) if children else (0, 0)
+        if pid:
+            started = children.pop(pid)
+            if not stopping:
+                failures = failures + 1 if now - started < RESTART_WINDOW else 0
+                delay = restart_delay(failures)
+                logger.warning('Worker %d exited with status %d, starting another in %.1fs', pid, status, delay)
+                restarts.append(now + delay)
+            continue
+        if stopping and now > stopping[0]:
+            for pid in children:
+                os.kill(pid, signal.SIGKILL)
+        relay_events(relays, 0.1)
+    for key in list(relays.get_map().values()):
+        close_relay(relays, key.fileobj)
+    relays.close()
+    sock.close()
+    logger.info('Stopped')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(message)s')
+    serve(args.host, args.port, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import unittest
+import time
+from api.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    """
+    Test cases for the in-process LRU cache
+    """
+
+    def test_get_and_set(self):
+        """
+        Test that a stored value is returned and counted as a hit
+        """
+        cache = LRUCache(maxsize=2)
+        self.assertIsNone(cache.get(1))
+        cache.set(1, 'one')
+        self.assertEqual(cache.get(1), 'one')
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_evicts_least_recently_used(self):
+        """
+        Test that the least recently used entry is evicted when the cache is full
+        """
+        cache = LRUCache(maxsize=2)
+        cache.set(1, 'one')
+        cache.set(2, 'two')
+        cache.get(1)
+        cache.set(3, 'three')
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(1), 'one')
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_ttl_expiry(self):
+        """
+        Test that entries expire after the time to live
+        """
+        cache = LRUCache(maxsize=2, ttl=0.01)
+        cache.set(1, 'one')
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(1))
+
+    def test_stale_set_after_invalidation_is_dropped(self):
+        """
+        Test that a value read before an invalidation is not stored after it
+        """
+        cache = LRUCache(maxsize=2)
+        generation = cache.generation()
+        cache.invalidate(1)
+        cache.set(1, 'stale', generation)
+        self.assertIsNone(cache.get(1))
+        cache.set(1, 'fresh', cache.generation())
+        self.assertEqual(cache.get(1), 'fresh')
+
+    def test_sync_clears_on_new_version(self):
+        """
+        Test that a new version of the source data clears the cache and an older one may not store values
+        """
+        cache = LRUCache(maxsize=2)
+        generation = cache.sync(1)
+        cache.set(1, 'one', generation)
+        self.assertEqual(cache.sync(1), generation)
+        self.assertEqual(cache.get(1), 'one')
+        generation = cache.sync(2)
+        self.assertIsNone(cache.get(1))
+        self.assertIsNone(cache.sync(1))
+        cache.set(1, 'fresh', generation)
+        self.assertEqual(cache.get(1), 'fresh')
+
+    def test_disabled(self):
+        """
+        Test that a cache with a size of 0 stores nothing
+        """
+        cache = LRUCache(maxsize=0)
+        cache.set(1, 'one')
+        self.assertIsNone(cache.get(1))
@@ -0,0 +1,65 @@
+import unittest
+from api.events import EventBus
+
+
+class TestEventBus(unittest.TestCase):
+    """
+    Test cases for the in-process event bus
+    """
+
+    def test_publish_to_every_subscriber(self):
+        """
+        Test that a published event reaches every subscriber with a sequence number
+        """
+        bus = EventBus()
+        first, second = bus.subscribe(), bus.subscribe()
+        event = bus.publish('book.created', {'ids': [1]})
+        self.assertEqual(first.get_nowait(), event)
+        self.assertEqual(second.get_nowait(), event)
+        self.assertEqual(bus.publish('book.deleted', {'ids': [1]})['id'], event['id'] + 1)
+
+    def test_full_queue_drops_oldest_event(self):
+        """
+        Test that a subscriber that falls behind loses its oldest events instead of blocking
+        """
+        bus = EventBus(maxsize=2)
+        subscriber = bus.subscribe()
+        for book_id in range(3):
+            bus.publish('book.created', {'ids': [book_id]})
+        self.assertEqual([subscriber.get_nowait()['data']['ids'] for _ in range(2)], [[1], [2]])
+        self.assertEqual(bus.dropped, 1)
+
+    def test_unsubscribe(self):
+        """
+        Test that an unsubscribed queue receives no more events
+        """
+        bus = EventBus()
+        subscriber = bus.subscribe()
+        bus.unsubscribe(subscriber)
+        bus.publish('book.created', {'ids': [1]})
+        self.assertTrue(subscriber.empty())
+        self.assertEqual(bus.subscriber_count(), 0)
+
+    def test_relay(self):
+        """
+        Test that published events are handed to the relay and delivered events are not
+        """
+        bus = EventBus()
+        relayed = []
+        bus.relay = lambda event_type, data: relayed.append((event_type, data))
+        subscriber = bus.subscribe()
+        bus.publish('book.created', {'ids': [1]})
+        bus.deliver('book.deleted', {'ids': [2]})
+        self.assertEqual(relayed, [('book.created', {'ids': [1]})])
+        self.assertEqual([subscriber.get_nowait()['type'] for _ in range(2)], ['book.created', 'book.deleted'])
+
+    def test_notify(self):
+        """
+        Test that a subscriber's notify callback is called after each event is queued for it
+        """
+        bus = EventBus()
+        sizes = []
+        subscriber = bus.subscribe(lambda: sizes.append(subscriber.qsize()))
+        bus.publish('book.created', {'ids': [1]})
+        bus.deliver('book.deleted', {'ids': [1]})
+        self.assertEqual(sizes, [1, 2])
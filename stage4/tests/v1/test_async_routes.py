@@ -0,0 +1,259 @@
+import unittest
+import asyncio
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+from datetime import date
+from api.v1.models import Books, BookTombstones
+from api import session, app, book_cache, book_events
+try:
+    import aiosqlite
+    import asgiref
+except ImportError:
+    aiosqlite = asgiref = None
+try:
+    import a2wsgi
+except ImportError:
+    a2wsgi = None
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+
+version = '/api/v1'
+STAGE4 = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@unittest.skipUnless(aiosqlite and asgiref, 'aiosqlite and asgiref are not installed')
+class TestAsyncRoutes(unittest.TestCase):
+    """
+    Test cases for the async read routes
+    """
+
+    def setUp(self):
+        """
+        Serve the read routes with the async views and add some books to the database
+        """
+        from api.v1.async_routes import async_views, run_in_event_loop
+        self.views = patch.dict(app.view_functions,
+                                {f'books_v1.{endpoint}': view for endpoint, view in async_views.items()})
+        self.views.start()
+        self.async_to_sync = patch.object(app, 'async_to_sync', run_in_event_loop)
+        self.async_to_sync.start()
+        session.add_all([
+            Books(title=f"Book {i}", author=f"Author {i}", genre="Fiction", publication_date=date(2024, 10, 31),
+                  availability_status="available", edition="1st Edition",
+                  summary=f"Summary of book {i}", description="An async book")
+            for i in range(1, 4)
+        ])
+        session.commit()
+        self.client = app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Close the connections of the async engine
+        """
+        from api.v1.async_routes import dispose_async_engine
+        dispose_async_engine()
+
+    def tearDown(self):
+        """
+        Restore the blocking views and delete the books from the database
+        """
+        self.views.stop()
+        self.async_to_sync.stop()
+        session.query(Books).delete()
+        session.query(BookTombstones).delete()
+        session.commit()
+        book_cache.clear()
+
+    def test_get_all_books(self):
+        """
+        Test that the async '/books' view pages through the books like the blocking one
+        """
+        response = self.client.get(f'{version}/books?limit=2&fields=title')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)['data']
+        self.assertEqual([book['title'] for book in data['books']], ['Book 1', 'Book 2'])
+        response = self.client.get(f"{version}/books?after={data['next_cursor']}")
+        self.assertEqual([book['title'] for book in json.loads(response.data)['data']['books']], ['Book 3'])
+        response = self.client.get(f"{version}/books?after={data['next_cursor']}",
+                                   headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(f'{version}/books?limit=0').status_code, 400)
+
+    def test_get_book(self):
+        """
+        Test that the async '/books/<id>' view returns a book, with validators, or a 404
+        """
+        book_id = session.query(Books).filter_by(title='Book 2').one().id
+        response = self.client.get(f'{version}/books/{book_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['data']['books'][0]['title'], 'Book 2')
+        response = self.client.get(f'{version}/books/{book_id}', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(f'{version}/books/0').status_code, 404)
+        session.query(Books).filter_by(id=book_id).update({'title': 'NEW'})
+        session.commit()
+        response = self.client.get(f'{version}/books/{book_id}')
+        self.assertEqual(json.loads(response.data)['data']['books'][0]['title'], 'NEW')
+
+    def test_get_books_batch_and_search(self):
+        """
+        Test that the async batch and search views return the requested books
+        """
+        ids = [book.id for book in session.query(Books).order_by(Books.id.desc())]
+        response = self.client.post(f'{version}/books/batch', json={'ids': ids + [0]})
+        data = json.loads(response.data)['data']
+        self.assertEqual([book['id'] for book in data['books']], ids)
+        self.assertEqual(data['missing_ids'], [0])
+        response = self.client.get(f'{version}/books/search?q=book+2')
+        books = json.loads(response.data)['data']['books']
+        self.assertEqual([book['title'] for book in books], ['Book 2'])
+        self.assertIn('[book]', books[0]['snippet'].lower())
+
+    @unittest.skipUnless(a2wsgi, 'a2wsgi is not installed')
+    def test_asgi_application(self):
+        """
+        Test that the ASGI entry point serves the API
+        """
+        from asgiref.testing import ApplicationCommunicator
+        from asgiref.sync import async_to_sync
+        from asgi import application
+
+        async def get(path):
+            communicator = ApplicationCommunicator(application, {
+                'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+                'path': path, 'raw_path': path.encode(), 'query_string': b'limit=1',
+                'root_path': '', 'headers': [], 'server': ('testserver', 80)
+            })
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(5)
+            body = await communicator.receive_output(5)
+            return start['status'], body['body']
+
+        status, body = async_to_sync(get)(f'{version}/books')
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(body)['data']['books']), 1)
+
+    @unittest.skipUnless(a2wsgi, 'a2wsgi is not installed')
+    def test_asgi_event_stream(self):
+        """
+        Test that the ASGI entry point streams book events on the event loop and unsubscribes on disconnect
+        """
+        from asgiref.testing import ApplicationCommunicator
+        from asgiref.sync import async_to_sync
+        from asgi import application
+        subscribers = book_events.subscriber_count()
+
+        async def stream():
+            communicator = ApplicationCommunicator(application, {
+                'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+                'path': f'{version}/books/events', 'raw_path': f'{version}/books/events'.encode(),
+                'query_string': b'', 'root_path': '', 'headers': [], 'server': ('testserver', 80)
+            })
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(5)
+            retry = await communicator.receive_output(5)
+            # Published from another thread, as a request thread would
+            await asyncio.get_running_loop().run_in_executor(
+                None, book_events.publish, 'book.deleted', {'ids': [1], 'count': 1})
+            event = await communicator.receive_output(5)
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait(5)
+            return start, retry['body'], event['body']
+
+        start, retry, event = async_to_sync(stream)()
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), start['headers'])
+        self.assertEqual(retry, b'retry: 3000\n\n')
+        self.assertIn('event: book.deleted', event.decode().splitlines())
+        self.assertEqual(book_events.subscriber_count(), subscribers)
+
+
+@unittest.skipUnless(a2wsgi and uvicorn, 'a2wsgi and uvicorn are not installed')
+class TestAsgiServer(unittest.TestCase):
+    """
+    Test cases for the ASGI entry point served by uvicorn
+    """
+
+    def setUp(self):
+        """
+        Start uvicorn with a pool of two request threads on a free port and a fresh database
+        """
+        self.directory = tempfile.mkdtemp()
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.port = sock.getsockname()[1]
+        env = dict(os.environ, LIBRARY_DATABASE_URL=f"sqlite:///{os.path.join(self.directory, 'library.db')}",
+                   LIBRARY_ASGI_THREADS='2')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1', '--port', str(self.port)],
+            cwd=STAGE4, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    self.fail('uvicorn did not start')
+                time.sleep(0.1)
+
+    def tearDown(self):
+        """
+        Stop uvicorn and remove the database
+        """
+        self.process.kill()
+        self.process.wait()
+        shutil.rmtree(self.directory)
+
+    def request(self, method, path, body=None):
+        """
+        Send a request to uvicorn, with a JSON body if one is given
+        """
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+        try:
+            if body is None:
+                connection.request(method, path)
+            else:
+                connection.request(method, path, json.dumps(body), {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def test_event_streams_leave_threads_free(self):
+        """
+        Test that more event streams than request threads neither block other requests nor miss events
+        """
+        streams = []
+        for _ in range(3):
+            connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+            self.addCleanup(connection.close)
+            connection.request('GET', f'{version}/books/events')
+            response = connection.getresponse()
+            self.assertEqual(response.readline(), b'retry: 3000\n')
+            streams.append(response)
+        status, _ = self.request('GET', f'{version}/books?limit=1')
+        self.assertEqual(status, 200)
+        book = {'title': 'T', 'author': 'A', 'genre': 'Fiction', 'publication_date': '2024-10-31',
+                'availability_status': 'available', 'edition': '1st', 'summary': 'S', 'description': 'D'}
+        status, _ = self.request('POST', f'{version}/books', book)
+        self.assertEqual(status, 201)
+        status, body = self.request('GET', f'{version}/books/export')
+        self.assertEqual((status, len(body.splitlines())), (200, 1))
+        for response in streams:
+            line = response.readline()
+            while not line.startswith(b'event: '):
+                line = response.readline()
+            self.assertEqual(line, b'event: book.created\n')
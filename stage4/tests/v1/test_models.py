@@ -1,7 +1,13 @@
 import unittest
-from api.v1.models import Books
-from api import session
-from datetime import datetime
+import threading
+from api.v1.models import Books, BookFacetCounts, BookTombstones
+from api import session, engine
+from api.v1.schema import init_schema
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from datetime import date, datetime
+import os
+import tempfile
 
 
 class TestDatabase(unittest.TestCase):
@@ -14,11 +20,11 @@ class TestDatabase(unittest.TestCase):
         Setup the database before each test
         """
         self.book1 = Books(title="Book 1", author="Author 1", description="This is a book",
-                           genre="Fiction", publication_date=datetime(2024, 10, 31, 23, 59, 59).date().isoformat(),
+                           genre="Fiction", publication_date=datetime(2024, 10, 31, 23, 59, 59).date(),
                            availability_status="returned",
                            edition="1st Edition", summary="This is a summary")
         self.book2 = Books(title="Book 2", author="Author 2", description="This is another book",
-                           genre="Non-Fiction", publication_date=datetime(2024, 10, 31, 23, 59, 59).date().isoformat(),
+                           genre="Non-Fiction", publication_date=datetime(2024, 10, 31, 23, 59, 59).date(),
                            availability_status="returned",
                            edition="2nd Edition", summary="This is another summary")
         session.add(self.book1)
@@ -71,8 +77,8 @@ class TestDatabase(unittest.TestCase):
         """
         self.assertEqual(session.query(Books).filter(Books.title == "Book 1").first().title, "Book 1")
         self.assertEqual(session.query(Books).filter(Books.author == "Author 1").first().author, "Author 1")
-        book = session.query(Books).filter(Books.publication_date == '2024-10-31').first()
-        self.assertEqual(book.publication_date, '2024-10-31')
+        book = session.query(Books).filter(Books.publication_date == date(2024, 10, 31)).first()
+        self.assertEqual(book.publication_date, date(2024, 10, 31))
         self.assertEqual(session.query(Books).filter(Books.availability_status == 'returned').first().availability_status, 'returned')
 
     def test_database_relationship(self):
@@ -122,3 +128,139 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(len(books), 1)
         self.assertEqual(books[0].title, "Book 1")
 
+
+    def test_session_is_scoped_per_thread(self):
+        """
+        Test that each thread gets its own session from the registry
+        """
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(session()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(sessions[0], session())
+
+    def test_sqlite_pragmas_applied(self):
+        """
+        Test that new connections are tuned with the configured pragmas
+        """
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
+            self.assertEqual(connection.execute(text('PRAGMA synchronous')).scalar(), 1)
+            self.assertEqual(connection.execute(text('PRAGMA busy_timeout')).scalar(), 5000)
+
+    def query_plan(self, query):
+        """
+        Return the SQLite query plan of an ORM query as one string
+        """
+        sql = query.statement.compile(engine, compile_kwargs={'literal_binds': True})
+        rows = session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all()
+        return ' '.join(row[-1] for row in rows)
+
+    def test_filters_use_indexes(self):
+        """
+        Test that filtering books by title, author, genre and availability status seeks an index
+        """
+        for column, value, index in (('title', 'Book 1', 'ix_books_title'), ('author', 'Author 1', 'ix_books_author'),
+                                     ('genre', 'Fiction', 'ix_books_genre_availability_status'),
+                                     ('availability_status', 'returned', 'ix_books_availability_status')):
+            plan = self.query_plan(session.query(Books).filter_by(**{column: value}))
+            self.assertIn(f'USING INDEX {index}', plan)
+            self.assertNotIn('SCAN', plan)
+        plan = self.query_plan(session.query(Books).filter_by(genre='Fiction', availability_status='returned'))
+        self.assertIn('USING INDEX ix_books_genre_availability_status', plan)
+        indexes = [row[1] for row in session.execute(text('PRAGMA index_list(books)'))]
+        self.assertNotIn('ix_books_genre', indexes)
+
+    def test_publication_date_range_uses_index(self):
+        """
+        Test that a publication date range is read with a range scan of the publication date index
+        """
+        query = session.query(Books).filter(Books.publication_date >= date(2024, 1, 1),
+                                            Books.publication_date <= date(2024, 12, 31))
+        plan = self.query_plan(query)
+        self.assertIn('USING INDEX ix_books_publication_date', plan)
+        self.assertEqual(query.count(), 2)
+
+    def test_facet_counts_follow_writes(self):
+        """
+        Test that the triggers keep the facet counts in step with inserts, updates and deletes
+        """
+        def counts(facet):
+            return dict(session.query(BookFacetCounts.value, BookFacetCounts.count).filter_by(facet=facet).all())
+        self.assertEqual(counts('genre'), {'Fiction': 1, 'Non-Fiction': 1})
+        self.book1.genre = 'Non-Fiction'
+        session.commit()
+        self.assertEqual(counts('genre'), {'Non-Fiction': 2})
+        session.delete(self.book2)
+        session.commit()
+        self.assertEqual(counts('genre'), {'Non-Fiction': 1})
+        self.assertEqual(counts('availability_status'), {'3': 1})
+        plan = self.query_plan(session.query(BookFacetCounts).filter_by(facet='genre')
+                               .order_by(BookFacetCounts.count.desc(), BookFacetCounts.value))
+        self.assertIn('INDEX ix_book_facet_counts_facet_count (facet=?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_change_feed_uses_index(self):
+        """
+        Test that reading the change feed after a cursor seeks the change_seq indexes
+        """
+        plan = self.query_plan(session.query(Books).filter(Books.change_seq > 1).order_by(Books.change_seq))
+        self.assertIn('USING INDEX ix_books_change_seq', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        plan = self.query_plan(session.query(BookTombstones).filter(BookTombstones.change_seq > 1)
+                               .order_by(BookTombstones.change_seq))
+        self.assertIn('USING INDEX ix_book_tombstones_change_seq', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class TestTypedColumnsMigration(unittest.TestCase):
+    """
+    Test cases for the migration of a string-typed books table
+    """
+
+    def setUp(self):
+        """
+        Create a database with the books table as it was before the typed columns
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.directory.name, 'legacy.db')}")
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE books (id INTEGER PRIMARY KEY, title VARCHAR(50) NOT NULL, "
+                "author VARCHAR(50) NOT NULL, genre VARCHAR(30) NOT NULL, description VARCHAR(200) NOT NULL, "
+                "publication_date VARCHAR NOT NULL, availability_status VARCHAR(15) NOT NULL, "
+                "edition VARCHAR(30) NOT NULL, summary VARCHAR NOT NULL, created_at VARCHAR(30) NOT NULL, "
+                "updated_at VARCHAR(30) NOT NULL)"
+            ))
+            connection.execute(text(
+                "INSERT INTO books VALUES (1, 'Book 1', 'Author 1', 'Fiction', 'A book', '2024-10-31', "
+                "'Available', '1st', 'A summary', '2024-10-31T23:59:59.000001Z', '2024-11-01T00:00:00.000000Z'), "
+                "(2, 'Book 2', 'Author 2', 'Fiction', 'A book', '2023-01-02T00:00:00', "
+                "'misplaced', '1st', 'A summary', '2024-10-31T23:59:59.000001Z', '2024-10-31T23:59:59.000001Z')"
+            ))
+
+    def tearDown(self):
+        """
+        Remove the temporary database
+        """
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def test_init_schema_converts_legacy_rows(self):
+        """
+        Test that init_schema converts string dates, timestamps and statuses to typed values
+        """
+        init_schema(self.engine)
+        init_schema(self.engine)
+        with Session(self.engine) as legacy_session:
+            book1, book2 = legacy_session.query(Books).order_by(Books.id).all()
+            self.assertEqual(book1.publication_date, date(2024, 10, 31))
+            self.assertEqual(book1.availability_status, 'available')
+            self.assertEqual(book1.created_at, datetime(2024, 10, 31, 23, 59, 59, 1))
+            self.assertEqual(book1.updated_at, datetime(2024, 11, 1))
+            self.assertEqual(book2.publication_date, date(2023, 1, 2))
+            self.assertEqual(book2.availability_status, 'unavailable')
+            self.assertEqual(legacy_session.query(Books).filter_by(availability_status='available').count(), 1)
+            facet_counts = legacy_session.query(BookFacetCounts.value, BookFacetCounts.count) \
+                .filter_by(facet='availability_status').order_by(BookFacetCounts.value).all()
+            self.assertEqual(facet_counts, [('0', 1), ('5', 1)])
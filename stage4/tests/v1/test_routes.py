@@ -1,8 +1,21 @@
 import unittest
 import json
-from api.v1.models import Books
+import gzip
+from unittest.mock import patch
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+from api.v1.models import Books, BookTombstones
 from datetime import datetime
-from api import session, app
+from api import session, app, book_cache, book_events
+from api.compression import compressed_cache
+from api.utils import encode_cursor
+from sqlalchemy import update
 
 
 version = '/api/v1'
@@ -18,15 +31,15 @@ class TestRoutes(unittest.TestCase):
         Setup the test client and add some books to the database
         """
         self.book1 = Books(title="Book 1", author="Author 1", genre="Non-Fiction",
-                           publication_date=datetime(2024, 10, 31, 23, 59, 59).date().isoformat(),
+                           publication_date=datetime(2024, 10, 31, 23, 59, 59).date(),
                            availability_status="available", edition="1st Edition",
                            summary="This is the first book", description="This is the first book")
         self.book2 = Books(title="Book 2", author="Author 2", genre="Fiction",
-                           publication_date=datetime(2024, 10, 31, 23, 59, 59).date().isoformat(),
+                           publication_date=datetime(2024, 10, 31, 23, 59, 59).date(),
                            availability_status="returned", edition="1st Edition",
                            summary="This is the second book", description="This is the second book")
         self.book3 = Books(title="Book 3", author="Author 3", genre="Non-Fiction",
-                           publication_date=datetime(2024, 10, 31, 23, 59, 59).date().isoformat(),
+                           publication_date=datetime(2024, 10, 31, 23, 59, 59).date(),
                            availability_status="available", edition="1st Edition",
                            summary="This is the third book", description="This is the third book")
         session.add_all([self.book1, self.book2, self.book3])
@@ -38,7 +51,9 @@ class TestRoutes(unittest.TestCase):
         Delete the books from the database after each test
         """
         session.query(Books).delete()
+        session.query(BookTombstones).delete()
         session.commit()
+        book_cache.clear()
 
     def test_get_all_books(self):
         """
@@ -49,6 +64,339 @@ class TestRoutes(unittest.TestCase):
         data = json.loads(response.data)
         self.assertEqual(len(data['data']['books']), 3)
 
+    def test_get_all_books_after_update(self):
+        """
+        Test that '/books' re-renders a book once it has been updated
+        """
+        self.client.get(f'{version}/books')
+        self.client.patch(f'{version}/books/bulk', data=json.dumps({'ids': [2], 'values': {'title': 'Book Two'}}),
+                          content_type='application/json')
+        data = json.loads(self.client.get(f'{version}/books').data)
+        self.assertEqual([book['title'] for book in data['data']['books']], ['Book 1', 'Book Two', 'Book 3'])
+
+    def test_get_all_books_sparse_fields(self):
+        """
+        Test that '/books?fields=' only returns the requested columns and the id
+        """
+        response = self.client.get(f'{version}/books?fields=title,availability_status&limit=2')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)['data']
+        self.assertEqual(data['books'][0], {'id': 1, 'title': 'Book 1', 'availability_status': 'available'})
+        self.assertIsNotNone(data['next_cursor'])
+        full_etag = self.client.get(f'{version}/books').headers['ETag']
+        self.assertNotEqual(self.client.get(f'{version}/books?fields=title').headers['ETag'], full_etag)
+        self.assertEqual(self.client.get(f'{version}/books?fields=title,colour').status_code, 400)
+
+    def test_export_books_sparse_fields(self):
+        """
+        Test that '/books/export?fields=' only exports the requested columns and the id
+        """
+        response = self.client.get(f'{version}/books/export?fields=author')
+        lines = response.data.decode().splitlines()
+        self.assertEqual(json.loads(lines[0]), {'id': 1, 'author': 'Author 1'})
+
+    def test_get_all_books_paginated(self):
+        """
+        Test that '/books' pages through the books with 'limit' and 'after'
+        """
+        response = self.client.get(f'{version}/books?limit=2')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual([book['title'] for book in data['data']['books']], ['Book 1', 'Book 2'])
+        cursor = data['data']['next_cursor']
+        self.assertIsNotNone(cursor)
+        response = self.client.get(f'{version}/books?limit=2&after={cursor}')
+        data = json.loads(response.data)
+        self.assertEqual([book['title'] for book in data['data']['books']], ['Book 3'])
+        self.assertIsNone(data['data']['next_cursor'])
+
+    def test_get_all_books_invalid_page_arguments(self):
+        """
+        Test that '/books' rejects an invalid limit or cursor with a 400 status code
+        """
+        self.assertEqual(self.client.get(f'{version}/books?limit=0').status_code, 400)
+        self.assertEqual(self.client.get(f'{version}/books?limit=abc').status_code, 400)
+        self.assertEqual(self.client.get(f'{version}/books?after=not-a-cursor').status_code, 400)
+
+    def test_get_books_filtered(self):
+        """
+        Test that '/books' only returns the books matching the filter query parameters
+        """
+        response = self.client.get(f'{version}/books?genre=Non-Fiction&availability_status=available')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual([book['title'] for book in data['data']['books']], ['Book 1', 'Book 3'])
+        response = self.client.get(f'{version}/books?title=Book+2')
+        data = json.loads(response.data)
+        self.assertEqual([book['author'] for book in data['data']['books']], ['Author 2'])
+        response = self.client.get(f'{version}/books?author=Nobody')
+        self.assertEqual(json.loads(response.data)['data']['books'], [])
+
+    def test_get_books_published_range(self):
+        """
+        Test that '/books' restricts the books to an inclusive publication date range
+        """
+        response = self.client.get(f'{version}/books?published_from=2024-10-31&published_to=2024-10-31')
+        self.assertEqual(len(json.loads(response.data)['data']['books']), 3)
+        response = self.client.get(f'{version}/books?published_from=2024-11-01')
+        self.assertEqual(json.loads(response.data)['data']['books'], [])
+        self.assertEqual(self.client.get(f'{version}/books?published_to=31-10-2024').status_code, 400)
+        self.assertEqual(self.client.get(f'{version}/books?availability_status=missing').status_code, 400)
+
+    def test_search_books(self):
+        """
+        Test that '/books/search' returns the books matching every word, ranked, with snippets
+        """
+        response = self.client.get(f'{version}/books/search?q=second+book')
+        self.assertEqual(response.status_code, 200)
+        books = json.loads(response.data)['data']['books']
+        self.assertEqual([book['title'] for book in books], ['Book 2'])
+        self.assertIn('[second]', books[0]['snippet'])
+        response = self.client.get(f'{version}/books/search?q=book&limit=2')
+        data = json.loads(response.data)['data']
+        self.assertEqual(len(data['books']), 2)
+        self.assertEqual(data['next_offset'], 2)
+
+    def test_search_books_follows_updates(self):
+        """
+        Test that the search index is kept in sync with updates and deletes
+        """
+        self.book1.summary = 'A story about dragons'
+        session.commit()
+        response = self.client.get(f'{version}/books/search?q=dragons')
+        self.assertEqual([book['title'] for book in json.loads(response.data)['data']['books']], ['Book 1'])
+        self.client.delete(f'{version}/books/1')
+        response = self.client.get(f'{version}/books/search?q=dragons')
+        self.assertEqual(json.loads(response.data)['data']['books'], [])
+
+    def test_search_books_invalid_query(self):
+        """
+        Test that '/books/search' without search words returns a 400 status code
+        and that FTS5 syntax in the words is matched literally
+        """
+        self.assertEqual(self.client.get(f'{version}/books/search?q=').status_code, 400)
+        self.assertEqual(self.client.get(f'{version}/books/search?q="unbalanced').status_code, 200)
+
+    def test_get_books_batch(self):
+        """
+        Test that '/books/batch' returns the requested books in order and reports the missing ids
+        """
+        response = self.client.get(f'{version}/books/batch?ids=3,99,1')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)['data']
+        self.assertEqual([book['title'] for book in data['books']], ['Book 3', 'Book 1'])
+        self.assertEqual(data['missing_ids'], [99])
+        response = self.client.post(f'{version}/books/batch', data=json.dumps({'ids': [2, 3]}),
+                                    content_type='application/json')
+        data = json.loads(response.data)['data']
+        self.assertEqual([book['title'] for book in data['books']], ['Book 2', 'Book 3'])
+        self.assertEqual(data['missing_ids'], [])
+
+    def test_get_books_batch_invalid(self):
+        """
+        Test that '/books/batch' with no ids or invalid ids returns a 400 status code
+        """
+        self.assertEqual(self.client.get(f'{version}/books/batch').status_code, 400)
+        self.assertEqual(self.client.get(f'{version}/books/batch?ids=1,abc').status_code, 400)
+        self.assertEqual(self.client.get(f'{version}/books/batch?ids=1,{2 ** 63}').status_code, 400)
+        response = self.client.post(f'{version}/books/batch', data=json.dumps({'ids': []}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_changes(self):
+        """
+        Test that '/books/changes' pages through the changes and reports later updates and deletes
+        """
+        response = self.client.get(f'{version}/books/changes?limit=2')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)['data']
+        self.assertEqual([book['title'] for book in data['books']], ['Book 1', 'Book 2'])
+        self.assertTrue(data['has_more'])
+        data = json.loads(self.client.get(f"{version}/books/changes?since={data['next_cursor']}").data)['data']
+        self.assertEqual([book['title'] for book in data['books']], ['Book 3'])
+        self.assertFalse(data['has_more'])
+        cursor = data['next_cursor']
+        data = json.loads(self.client.get(f'{version}/books/changes?since={cursor}').data)['data']
+        self.assertEqual((data['books'], data['deleted'], data['next_cursor']), ([], [], cursor))
+        self.client.patch(f'{version}/books/3', data=json.dumps({'edition': '2nd Edition'}),
+                          content_type='application/json')
+        self.client.delete(f'{version}/books/1')
+        data = json.loads(self.client.get(f'{version}/books/changes?since={cursor}').data)['data']
+        self.assertEqual([book['id'] for book in data['books']], [3])
+        self.assertEqual([book['id'] for book in data['deleted']], [1])
+
+    def test_get_changes_commit_order(self):
+        """
+        Test that '/books/changes' reports a change committed after the cursor even when its updated_at is older
+        """
+        cursor = json.loads(self.client.get(f'{version}/books/changes').data)['data']['next_cursor']
+        session.execute(update(Books).where(Books.id == 1).values(updated_at=datetime(2000, 1, 1)))
+        session.commit()
+        data = json.loads(self.client.get(f'{version}/books/changes?since={cursor}').data)['data']
+        self.assertEqual([book['id'] for book in data['books']], [1])
+        self.assertNotEqual(data['next_cursor'], cursor)
+
+    def test_get_changes_invalid_cursor(self):
+        """
+        Test that '/books/changes' with a malformed or a timestamp cursor returns a 400 status code
+        """
+        self.assertEqual(self.client.get(f'{version}/books/changes?since=bad').status_code, 400)
+        cursor = encode_cursor(1)
+        self.assertEqual(self.client.get(f'{version}/books/changes?since={cursor}').status_code, 400)
+
+    def test_get_facets(self):
+        """
+        Test that '/books/facets' counts the books per genre, author and availability status
+        """
+        response = self.client.get(f'{version}/books/facets')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)['data']
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['facets']['genre'], [{'value': 'Non-Fiction', 'count': 2},
+                                                   {'value': 'Fiction', 'count': 1}])
+        self.assertEqual(data['facets']['availability_status'], [{'value': 'available', 'count': 2},
+                                                                 {'value': 'returned', 'count': 1}])
+        self.assertEqual(len(data['facets']['author']), 3)
+        response = self.client.get(f'{version}/books/facets?facets=genre&limit=1')
+        self.assertEqual(json.loads(response.data)['data']['facets'], {'genre': [{'value': 'Non-Fiction', 'count': 2}]})
+
+    def test_get_facets_follow_writes(self):
+        """
+        Test that the facet counts follow updates and deletions
+        """
+        self.client.patch(f'{version}/books/1', data=json.dumps({'availability_status': 'lost', 'genre': 'Poetry'}),
+                          content_type='application/json')
+        self.client.delete(f'{version}/books/2')
+        data = json.loads(self.client.get(f'{version}/books/facets').data)['data']
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(data['facets']['genre'], [{'value': 'Non-Fiction', 'count': 1},
+                                                   {'value': 'Poetry', 'count': 1}])
+        self.assertEqual(data['facets']['availability_status'], [{'value': 'available', 'count': 1},
+                                                                 {'value': 'lost', 'count': 1}])
+
+    def test_get_facets_filtered(self):
+        """
+        Test that '/books/facets' only counts the books matching the filters, and rejects unknown facets
+        """
+        response = self.client.get(f'{version}/books/facets?genre=Non-Fiction&facets=availability_status')
+        data = json.loads(response.data)['data']
+        self.assertEqual(data, {'facets': {'availability_status': [{'value': 'available', 'count': 2}]}, 'total': 2})
+        self.assertEqual(self.client.get(f'{version}/books/facets?facets=colour').status_code, 400)
+
+    def test_export_books_ndjson(self):
+        """
+        Test that '/books/export' streams every book as one JSON object per line
+        """
+        response = self.client.get(f'{version}/books/export')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = response.data.decode().splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], ['Book 1', 'Book 2', 'Book 3'])
+
+    def test_export_books_json(self):
+        """
+        Test that '/books/export?format=json' streams every book as a JSON array
+        """
+        response = self.client.get(f'{version}/books/export?format=json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.data)), 3)
+        self.assertEqual(self.client.get(f'{version}/books/export?format=xml').status_code, 400)
+
+    def test_get_all_books_compressed(self):
+        """
+        Test that '/books' is gzip-compressed for clients that accept it, with its own ETag
+        """
+        plain = self.client.get(f'{version}/books')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+        with patch('api.compression.COMPRESSION_MIN_SIZE', 0):
+            response = self.client.get(f'{version}/books', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+        self.assertEqual(response.headers['ETag'], plain.headers['ETag'][:-1] + '-gzip"')
+        response = self.client.get(f'{version}/books', headers={'Accept-Encoding': 'gzip',
+                                                                'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertTrue(response.headers['ETag'].endswith('-gzip"'))
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+    def test_small_response_not_compressed(self):
+        """
+        Test that responses under the size threshold are sent uncompressed
+        """
+        response = self.client.get(f'{version}/books/1', headers={'Accept-Encoding': 'gzip'})
+        self.assertLess(len(response.data), 1024)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_export_books_compressed(self):
+        """
+        Test that '/books/export' is compressed as it streams, and served from the compressed cache until a book changes
+        """
+        plain = self.client.get(f'{version}/books/export')
+        hits = compressed_cache.stats()['hits']
+        first = self.client.get(f'{version}/books/export', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(first.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(first.data), plain.data)
+        second = self.client.get(f'{version}/books/export', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(compressed_cache.stats()['hits'], hits + 1)
+        response = self.client.get(f'{version}/books/export', headers={'If-None-Match': plain.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.client.delete(f'{version}/books/3')
+        third = self.client.get(f'{version}/books/export', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotEqual(third.headers['ETag'], first.headers['ETag'])
+        self.assertEqual(len(gzip.decompress(third.data).splitlines()), 2)
+
+    def test_export_books_etag_follows_commits(self):
+        """
+        Test that the '/books/export' ETag changes with an update whose updated_at is older than the latest one
+        """
+        first = self.client.get(f'{version}/books/export', headers={'Accept-Encoding': 'gzip'})
+        session.execute(update(Books).where(Books.id == 1).values(title='Renamed', updated_at=datetime(2000, 1, 1)))
+        session.commit()
+        response = self.client.get(f'{version}/books/export', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        second = self.client.get(f'{version}/books/export', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotEqual(second.headers['ETag'], first.headers['ETag'])
+        self.assertIn(b'Renamed', gzip.decompress(second.data))
+
+    @unittest.skipUnless(msgpack, 'msgpack is not installed')
+    def test_get_all_books_msgpack(self):
+        """
+        Test that '/books' returns the same envelope in MessagePack when the client asks for it
+        """
+        plain = self.client.get(f'{version}/books')
+        response = self.client.get(f'{version}/books', headers={'Accept': 'application/msgpack'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.data), json.loads(plain.data))
+        self.assertNotEqual(response.headers['ETag'], plain.headers['ETag'])
+        self.assertIn('Accept', response.headers['Vary'])
+        response = self.client.get(f'{version}/books/1', headers={'Accept': 'application/msgpack'})
+        self.assertEqual(msgpack.unpackb(response.data)['data']['books'][0]['title'], 'Book 1')
+        response = self.client.get(f'{version}/books/0', headers={'Accept': 'application/msgpack'})
+        self.assertEqual(msgpack.unpackb(response.data)['http_code'], 404)
+
+    @unittest.skipUnless(cbor2, 'cbor2 is not installed')
+    def test_get_all_books_cbor(self):
+        """
+        Test that '/books' returns the same envelope in CBOR when the client asks for it
+        """
+        plain = self.client.get(f'{version}/books')
+        response = self.client.get(f'{version}/books', headers={'Accept': 'application/cbor'})
+        self.assertEqual(response.mimetype, 'application/cbor')
+        self.assertEqual(cbor2.loads(response.data), json.loads(plain.data))
+
+    def test_get_all_books_prefers_json(self):
+        """
+        Test that clients accepting any media type get JSON
+        """
+        response = self.client.get(f'{version}/books', headers={'Accept': '*/*'})
+        self.assertEqual(response.mimetype, 'application/json')
+        response = self.client.get(f'{version}/books', headers={'Accept': 'text/html'})
+        self.assertEqual(response.mimetype, 'application/json')
+
     def test_get_book_by_id(self):
         """
         Test that a GET request to '/books/<id>' returns a book with the given id
@@ -59,6 +407,66 @@ class TestRoutes(unittest.TestCase):
         self.assertEqual(data['data']['books'][0]['title'], 'Book 1')
         self.assertEqual(data['data']['books'][0]['author'], 'Author 1')
 
+    def test_get_book_conditional(self):
+        """
+        Test that '/books/<id>' answers a matching If-None-Match or If-Modified-Since with a 304
+        """
+        response = self.client.get(f'{version}/books/1')
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+        response = self.client.get(f'{version}/books/1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        response = self.client.get(f'{version}/books/1', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+        self.client.patch(f'{version}/books/bulk', data=json.dumps({'ids': [1], 'values': {'availability_status': 'borrowed'}}),
+                          content_type='application/json')
+        response = self.client.get(f'{version}/books/1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_get_all_books_conditional(self):
+        """
+        Test that '/books' answers a matching If-None-Match with a 304 until a book changes
+        """
+        etag = self.client.get(f'{version}/books').headers['ETag']
+        response = self.client.get(f'{version}/books', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.client.delete(f'{version}/books/2')
+        response = self.client.get(f'{version}/books', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_book_cached(self):
+        """
+        Test that '/books/<id>' serves repeated lookups from the cache and that updates invalidate it
+        """
+        book_cache.clear()
+        before = book_cache.stats()
+        self.client.get(f'{version}/books/1')
+        self.client.get(f'{version}/books/1')
+        stats = json.loads(self.client.get(f'{version}/cache/stats').data)['data']['cache']
+        self.assertEqual(stats['misses'] - before['misses'], 1)
+        self.assertEqual(stats['hits'] - before['hits'], 1)
+        data = {'title': 'Book One', 'author': 'Author 1',
+                'genre': 'Non-Fiction', 'publication_date': '2024-10-31',
+                'availability_status': 'returned', 'edition': '1st Edition',
+                'summary': 'This is the first book', 'description': 'This is the first book'}
+        self.client.put(f'{version}/books/1', data=json.dumps(data), content_type='application/json')
+        response = self.client.get(f'{version}/books/1')
+        self.assertEqual(json.loads(response.data)['data']['books'][0]['title'], 'Book One')
+        self.client.delete(f'{version}/books/1')
+        self.assertEqual(self.client.get(f'{version}/books/1').status_code, 404)
+
+    def test_get_book_cache_follows_other_writers(self):
+        """
+        Test that '/books/<id>' serves a change committed without invalidating the book cache, as another worker would
+        """
+        self.assertEqual(json.loads(self.client.get(f'{version}/books/1').data)['data']['books'][0]['title'], 'Book 1')
+        session.execute(update(Books).where(Books.id == 1).values(title='NEW'))
+        session.commit()
+        response = self.client.get(f'{version}/books/1')
+        self.assertEqual(json.loads(response.data)['data']['books'][0]['title'], 'NEW')
+
     def test_get_book_by_id_non_existent(self):
         """
         Test that a GET request to '/books/<id>' with a non-existent id returns a 404 status code
@@ -129,6 +537,122 @@ class TestRoutes(unittest.TestCase):
                                content_type='application/json')
         self.assertEqual(response.status_code, 400)
 
+    def test_post_books_bulk(self):
+        """
+        Test that a POST request to '/books/bulk' creates the valid books and reports the invalid ones
+        """
+        book = {'title': 'Book 4', 'author': 'Author 4',
+                'genre': 'Fiction', 'publication_date': '2024-10-31',
+                'availability_status': 'returned', 'edition': '1st Edition',
+                'summary': 'This is the fourth book', 'description': 'This is the fourth book'}
+        books = [book, dict(book, title='Book 5'), {'title': 'Book 6'},
+                 dict(book, publication_date='31/10/2024'), 'Book 7', dict(book, title='Book 8')]
+        response = self.client.post(f'{version}/books/bulk?batch_size=2', data=json.dumps(books),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data)['data']
+        self.assertEqual(data['created'], 3)
+        self.assertEqual([error['index'] for error in data['errors']], [2, 3, 4])
+        self.assertEqual(session.query(Books).count(), 6)
+
+    def test_post_books_bulk_null_field(self):
+        """
+        Test that '/books/bulk' reports a book with a null or non-string field and creates the others
+        """
+        book = {'title': 'Book 4', 'author': 'Author 4',
+                'genre': 'Fiction', 'publication_date': '2024-10-31',
+                'availability_status': 'returned', 'edition': '1st Edition',
+                'summary': 'This is the fourth book', 'description': 'This is the fourth book'}
+        books = [book, dict(book, title=None), dict(book, author=['Author 5']), dict(book, title='Book 7')]
+        response = self.client.post(f'{version}/books/bulk', data=json.dumps(books),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data)['data']
+        self.assertEqual(data['created'], 2)
+        self.assertEqual([error['index'] for error in data['errors']], [1, 2])
+        self.assertIn('title', data['errors'][0]['details'])
+        self.assertEqual(session.query(Books).count(), 5)
+
+    def test_post_books_bulk_ndjson(self):
+        """
+        Test that '/books/bulk' accepts one book per line as NDJSON
+        """
+        book = {'title': 'Book 4', 'author': 'Author 4',
+                'genre': 'Fiction', 'publication_date': '2024-10-31',
+                'availability_status': 'returned', 'edition': '1st Edition',
+                'summary': 'This is the fourth book', 'description': 'This is the fourth book'}
+        body = json.dumps(book) + '\n' + '{not json\n' + json.dumps(dict(book, title='Book 5')) + '\n'
+        response = self.client.post(f'{version}/books/bulk', data=body,
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data)['data']
+        self.assertEqual(data['created'], 2)
+        self.assertEqual(data['errors'][0]['index'], 1)
+
+    def test_post_books_bulk_invalid(self):
+        """
+        Test that '/books/bulk' returns a 400 status code when no book could be added
+        """
+        response = self.client.post(f'{version}/books/bulk', data=json.dumps({'title': 'Book 4'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(f'{version}/books/bulk', data=json.dumps([{'title': 'Book 4'}]),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(session.query(Books).count(), 3)
+
+    def test_patch_books_bulk(self):
+        """
+        Test that a PATCH request to '/books/bulk' updates the selected books and returns the count
+        """
+        body = {'filter': {'genre': 'Non-Fiction'}, 'values': {'availability_status': 'borrowed'}}
+        response = self.client.patch(f'{version}/books/bulk', data=json.dumps(body),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['data']['updated'], 2)
+        self.assertEqual(session.query(Books).filter_by(availability_status='borrowed').count(), 2)
+        body = {'ids': [2, 99], 'values': {'edition': '2nd Edition'}}
+        response = self.client.patch(f'{version}/books/bulk', data=json.dumps(body),
+                                     content_type='application/json')
+        self.assertEqual(json.loads(response.data)['data']['updated'], 1)
+
+    def test_patch_books_bulk_invalid(self):
+        """
+        Test that '/books/bulk' refuses an empty or ambiguous selection, unknown fields and invalid values
+        """
+        for body in ({'values': {'edition': '2nd'}},
+                     {'ids': [1], 'filter': {'genre': 'Fiction'}, 'values': {'edition': '2nd'}},
+                     {'filter': {'colour': 'red'}, 'values': {'edition': '2nd'}},
+                     {'ids': [1], 'values': {'colour': 'red'}},
+                     {'ids': [1], 'values': {'publication_date': '31/10/2024'}},
+                     {'ids': [1], 'values': {'title': None}},
+                     {'filter': {'genre': 'Fiction'}, 'values': {'summary': {'text': 'x'}}},
+                     {'filter': {'title': ['a']}, 'values': {'edition': '2nd'}},
+                     {'filter': {'title': {'a': 1}}, 'values': {'edition': '2nd'}},
+                     {'ids': [True], 'values': {'edition': '2nd'}},
+                     {'ids': [2 ** 63], 'values': {'edition': '2nd'}}):
+            response = self.client.patch(f'{version}/books/bulk', data=json.dumps(body),
+                                         content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_delete_books_bulk(self):
+        """
+        Test that a DELETE request to '/books/bulk' deletes the selected books and returns the count
+        """
+        response = self.client.delete(f'{version}/books/bulk', data=json.dumps({'ids': [1, 3]}),
+                                      content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['data']['deleted'], 2)
+        response = self.client.delete(f'{version}/books/bulk', data=json.dumps({'filter': {'author': 'Author 2'}}),
+                                      content_type='application/json')
+        self.assertEqual(json.loads(response.data)['data']['deleted'], 1)
+        self.assertEqual(session.query(Books).count(), 0)
+        for body in ({}, {'filter': {'title': ['a']}}, {'filter': {'author': None}}, {'ids': [1, True]},
+                     {'ids': [2 ** 70]}):
+            response = self.client.delete(f'{version}/books/bulk', data=json.dumps(body),
+                                          content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
     def test_put_book_update(self):
         """
         Test that a PUT request to '/books/<id>' updates a book with the given id
@@ -204,6 +728,104 @@ class TestRoutes(unittest.TestCase):
                                content_type='application/json')
         self.assertEqual(response.status_code, 400)
 
+    def test_patch_book(self):
+        """
+        Test that a PATCH request to '/books/<id>' only changes the given fields
+        """
+        response = self.client.patch(f'{version}/books/2', data=json.dumps({'availability_status': 'borrowed'}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        book = json.loads(response.data)['data']['books'][0]
+        self.assertEqual(book['availability_status'], 'borrowed')
+        self.assertEqual(book['title'], 'Book 2')
+        self.assertNotEqual(book['updated_at'], book['created_at'])
+
+    def test_patch_book_optimistic_concurrency(self):
+        """
+        Test that a PATCH request carrying a stale updated_at returns a 409 status code
+        """
+        updated_at = json.loads(self.client.get(f'{version}/books/1').data)['data']['books'][0]['updated_at']
+        response = self.client.patch(f'{version}/books/1', data=json.dumps({'edition': '2nd', 'updated_at': updated_at}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(f'{version}/books/1', data=json.dumps({'edition': '3rd', 'updated_at': updated_at}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(self.client.get(f'{version}/books/1').data)['data']['books'][0]['edition'], '2nd')
+
+    def test_patch_book_invalid(self):
+        """
+        Test that a PATCH request with unknown fields, no fields, invalid values or an unknown id is rejected
+        """
+        response = self.client.patch(f'{version}/books/1', data=json.dumps({'colour': 'red'}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(f'{version}/books/1', data=json.dumps({}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(f'{version}/books/1', data=json.dumps({'availability_status': 'missing'}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        for values in ({'title': None}, {'title': ['x']}, {'edition': 2}):
+            response = self.client.patch(f'{version}/books/1', data=json.dumps(values),
+                                         content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        response = self.client.patch(f'{version}/books/0', data=json.dumps({'edition': '2nd'}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_write_routes_publish_events(self):
+        """
+        Test that creating, updating and deleting books publishes events to subscribers
+        """
+        subscriber = book_events.subscribe()
+        try:
+            data = {'title': 'Book 4', 'author': 'Author 4',
+                    'genre': 'Fiction', 'publication_date': '2024-10-31',
+                    'availability_status': 'returned', 'edition': '1st Edition',
+                    'summary': 'This is the fourth book', 'description': 'This is the fourth book'}
+            self.client.post(f'{version}/books', data=json.dumps(data), content_type='application/json')
+            self.client.patch(f'{version}/books/1', data=json.dumps({'edition': '2nd'}),
+                              content_type='application/json')
+            self.client.delete(f'{version}/books/bulk', data=json.dumps({'filter': {'genre': 'Fiction'}}),
+                               content_type='application/json')
+            events = [subscriber.get_nowait() for _ in range(3)]
+        finally:
+            book_events.unsubscribe(subscriber)
+        self.assertEqual([event['type'] for event in events], ['book.created', 'book.updated', 'book.deleted'])
+        self.assertEqual(events[1]['data'], {'ids': [1], 'count': 1})
+        self.assertEqual(events[2]['data'], {'filter': {'genre': 'Fiction'}, 'count': 2})
+
+    def test_stream_events(self):
+        """
+        Test that '/books/events' streams published events as Server-Sent Events
+        """
+        response = self.client.get(f'{version}/books/events', buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        chunks = iter(response.response)
+        self.assertEqual(next(chunks), b'retry: 3000\n\n')
+        self.client.delete(f'{version}/books/2')
+        event = next(chunks).decode()
+        response.close()
+        lines = event.splitlines()
+        self.assertIn('event: book.deleted', lines)
+        data = [line for line in lines if line.startswith('data: ')][0]
+        self.assertEqual(json.loads(data[len('data: '):]), {'ids': [2], 'count': 1})
+
+    def test_stream_events_unsubscribes(self):
+        """
+        Test that '/books/events' leaves no subscriber behind when the response is closed, read or not
+        """
+        subscribers = book_events.subscriber_count()
+        response = self.client.get(f'{version}/books/events', buffered=False)
+        response.close()
+        self.assertEqual(book_events.subscriber_count(), subscribers)
+        response = self.client.get(f'{version}/books/events', buffered=False)
+        next(iter(response.response))
+        self.assertEqual(book_events.subscriber_count(), subscribers + 1)
+        response.close()
+        self.assertEqual(book_events.subscriber_count(), subscribers)
+
     def test_delete_book(self):
         """
         Test that a DELETE request to '/books/<id>' deletes a book with the given id
@@ -0,0 +1,205 @@
+import unittest
+import http.client
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from serve import RequestTracker, listen, restart_delay
+
+
+STAGE4 = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class TestRequestTracker(unittest.TestCase):
+    """
+    Test cases for the middleware counting the requests in progress
+    """
+
+    def test_counts_until_response_closed(self):
+        """
+        Test that a request is in progress until its response is closed
+        """
+        def application(environ, start_response):
+            start_response('200 OK', [])
+            return iter([b'a', b'b'])
+
+        tracker = RequestTracker(application)
+        response = tracker({}, lambda status, headers: None)
+        self.assertEqual(tracker.active, 1)
+        self.assertFalse(tracker.wait_idle(0))
+        self.assertEqual(b''.join(response), b'ab')
+        response.close()
+        self.assertEqual(tracker.active, 0)
+        self.assertTrue(tracker.wait_idle(0))
+
+    def test_counts_failed_request(self):
+        """
+        Test that a request whose application raised is not left in progress
+        """
+        def application(environ, start_response):
+            raise RuntimeError('failed')
+
+        tracker = RequestTracker(application)
+        with self.assertRaises(RuntimeError):
+            tracker({}, lambda status, headers: None)
+        self.assertEqual(tracker.active, 0)
+
+
+class TestRestartDelay(unittest.TestCase):
+    """
+    Test cases for the delay before a dead worker is replaced
+    """
+
+    def test_backs_off(self):
+        """
+        Test that the delay doubles with each failure in a row and is capped
+        """
+        self.assertEqual(restart_delay(0), 0)
+        self.assertEqual([restart_delay(failures) for failures in (1, 2, 3)], [0.5, 1, 2])
+        self.assertEqual(restart_delay(100), 30)
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'os.fork is not available')
+class TestServe(unittest.TestCase):
+    """
+    Test cases for the pre-fork launcher
+    """
+
+    def setUp(self):
+        """
+        Start the launcher with two workers on a free port and a fresh database
+        """
+        self.directory = tempfile.mkdtemp()
+        with listen('127.0.0.1', 0) as sock:
+            self.port = sock.getsockname()[1]
+        env = dict(os.environ, LIBRARY_DATABASE_URL=f"sqlite:///{os.path.join(self.directory, 'library.db')}",
+                   LIBRARY_SHUTDOWN_TIMEOUT='5')
+        self.process = subprocess.Popen(
+            [sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(self.port), '--workers', '2'],
+            cwd=STAGE4, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    self.fail('The launcher did not start')
+                time.sleep(0.1)
+
+    def tearDown(self):
+        """
+        Stop the launcher and remove the database
+        """
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        shutil.rmtree(self.directory)
+
+    def request(self, method, path, body=None):
+        """
+        Send a request to the launcher, with a JSON body if one is given
+        """
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            if body is None:
+                connection.request(method, path)
+            else:
+                connection.request(method, path, json.dumps(body), {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def get(self, path):
+        """
+        Send a GET request to the launcher
+        """
+        return self.request('GET', path)
+
+    def children(self):
+        """
+        Wait until the launcher runs two workers and return their process ids, or None if /proc does not list them
+        """
+        children = f'/proc/{self.process.pid}/task/{self.process.pid}/children'
+        if not os.path.exists(children):
+            return None
+        deadline = time.monotonic() + 10
+        while True:
+            with open(children) as f:
+                pids = [int(pid) for pid in f.read().split()]
+            if len(pids) == 2 or time.monotonic() > deadline:
+                return pids
+            time.sleep(0.1)
+
+    def test_serves_and_stops(self):
+        """
+        Test that the workers serve requests and exit on SIGTERM
+        """
+        pids = self.children()
+        if pids is not None:
+            self.assertEqual(len(pids), 2)
+        for _ in range(4):
+            status, _ = self.get('/api/v1/books')
+            self.assertEqual(status, 200)
+        self.process.send_signal(signal.SIGTERM)
+        self.assertEqual(self.process.wait(timeout=15), 0)
+        with self.assertRaises(OSError):
+            socket.create_connection(('127.0.0.1', self.port), timeout=1).close()
+
+    def test_replaces_dead_worker(self):
+        """
+        Test that a worker killed by a signal is replaced and the others keep serving
+        """
+        pids = self.children()
+        if pids is None:
+            self.skipTest('/proc does not list the child processes')
+        self.assertEqual(len(pids), 2)
+        os.kill(pids[0], signal.SIGKILL)
+        deadline = time.monotonic() + 10
+        while pids[0] in self.children() or len(self.children()) < 2:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.1)
+        self.assertIn(pids[1], self.children())
+        status, _ = self.get('/api/v1/books')
+        self.assertEqual(status, 200)
+
+    def test_workers_share_changes(self):
+        """
+        Test that a change made through one worker is served by every worker and streamed to every event client
+        """
+        book = {'title': 'T', 'author': 'A', 'genre': 'Fiction', 'publication_date': '2024-10-31',
+                'availability_status': 'available', 'edition': '1st', 'summary': 'S', 'description': 'D'}
+        status, body = self.request('POST', '/api/v1/books', book)
+        self.assertEqual(status, 201)
+        book_id = json.loads(body)['data']['books'][0]['id']
+        for _ in range(10):
+            self.get(f'/api/v1/books/{book_id}')
+        streams = []
+        for _ in range(6):
+            connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+            self.addCleanup(connection.close)
+            connection.request('GET', '/api/v1/books/events')
+            response = connection.getresponse()
+            self.assertEqual(response.readline(), b'retry: 3000\n')
+            response.readline()
+            streams.append(response)
+        status, _ = self.request('PATCH', f'/api/v1/books/{book_id}', {'title': 'NEW'})
+        self.assertEqual(status, 200)
+        for _ in range(20):
+            status, body = self.get(f'/api/v1/books/{book_id}')
+            self.assertEqual(json.loads(body)['data']['books'][0]['title'], 'NEW')
+        for response in streams:
+            line = response.readline()
+            while not line.startswith(b'event: '):
+                line = response.readline()
+            self.assertEqual(line, b'event: book.updated\n')
+
+
+if __name__ == '__main__':
+    unittest.main()